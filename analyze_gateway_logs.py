@@ -2,79 +2,143 @@ import sys
 import os
 import json
 import math
-from collections import defaultdict, Counter
-from typing import Dict, List, Tuple, Iterable
+import mmap
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from typing import BinaryIO, Dict, List, Sequence, Tuple, Iterable
 from urllib.parse import urlsplit
 
+try:
+    import orjson as _json
+except ImportError:  # stdlib json also accepts bytes
+    import json as _json
+
 
 LOG_PATH = None  # Log path must be provided via CLI argument
+READ_BUFFER_SIZE = 1 << 20  # 1 MiB reads for logs that cannot be mmapped
 
+# the JSON object of a gateway_fetch line, from its opening brace to the last one on the line;
+# only run on lines that contain GATEWAY_FETCH_MARKER, never over the whole file
+GATEWAY_FETCH_MARKER = b'"gateway_fetch"'
+GATEWAY_FETCH_RE = re.compile(rb'\{[^\n]*"event":[ \t]*"gateway_fetch"[^\n]*\}')
 
-def read_lines(path: str) -> Iterable[str]:
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            yield line
+# Log-spaced-ish buckets in ms; the last label collects everything above the top bucket
+_BUCKETS = [10, 20, 50, 100, 200, 300, 500, 800, 1000, 1500, 2000, 3000, 5000, 8000]
+_BUCKET_LABELS = [f"<= {b}ms" for b in _BUCKETS] + [f"> {_BUCKETS[-1]}ms"]
 
 
-def parse_json_after_bracket(line: str) -> dict:
+def parse_json_after_bracket(line: bytes) -> dict:
     # lines look like: [ts] {json}
-    idx = line.find("{")
+    idx = line.find(b"{")
     if idx == -1:
         return {}
     try:
-        return json.loads(line[idx:])
+        return _json.loads(line[idx:])
     except Exception:
         return {}
 
 
-def p95(values: List[int]) -> float:
-    if not values:
-        return float("nan")
-    arr = sorted(values)
-    k = int(math.ceil(0.95 * len(arr))) - 1
-    k = max(0, min(k, len(arr) - 1))
-    return float(arr[k])
-
-
-def human_stats(values: List[int]) -> Dict[str, float]:
+def read_blocks(f: BinaryIO) -> Iterable[bytes]:
+    # ~1 MiB runs of whole lines: one rfind per block instead of a Python step per line
+    tail = b""
+    while True:
+        chunk = f.read(READ_BUFFER_SIZE)
+        if not chunk:
+            if tail:
+                yield tail
+            return
+        cut = chunk.rfind(b"\n")
+        if cut == -1:
+            tail += chunk
+            continue
+        yield tail + chunk[:cut + 1]
+        tail = chunk[cut + 1:]
+
+
+def find_gateway_fetch(buf) -> Iterable[bytes]:
+    # bytes.find jumps straight to lines naming the event; every other line is skipped
+    # at memchr speed and the regex only ever sees one candidate line at a time
+    size = len(buf)
+    pos = 0
+    while True:
+        hit = buf.find(GATEWAY_FETCH_MARKER, pos)
+        if hit == -1:
+            return
+        start = buf.rfind(b"\n", 0, hit) + 1
+        end = buf.find(b"\n", hit)
+        if end == -1:
+            end = size
+        m = GATEWAY_FETCH_RE.search(buf, start, end)
+        if m:
+            yield m.group()
+        pos = end + 1
+
+
+def iter_gateway_fetch(path: str) -> Iterable[dict]:
+    # one C-level scan over the mapped file; JSON is only decoded at hits
+    with open(path, "rb", buffering=0) as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # empty files and pipes cannot be mapped; run the same scan over line-aligned blocks
+            for block in read_blocks(f):
+                for obj in find_gateway_fetch(block):
+                    yield parse_json_after_bracket(obj)
+            return
+        with mm:
+            for obj in find_gateway_fetch(mm):
+                yield parse_json_after_bracket(obj)
+
+
+def human_stats(values: Sequence[int]) -> Dict[str, float]:
     if not values:
         return {"count": 0, "avg_ms": float("nan"), "median_ms": float("nan"), "p95_ms": float("nan"), "min_ms": float("nan"), "max_ms": float("nan")}
+    # one sort serves median, p95 and the range
     arr = sorted(values)
-    mid = len(arr) // 2
-    if len(arr) % 2 == 1:
+    n = len(arr)
+    mid = n // 2
+    if n % 2 == 1:
         median = float(arr[mid])
     else:
         median = (arr[mid - 1] + arr[mid]) / 2.0
+    k = int(math.ceil(0.95 * n)) - 1
+    k = max(0, min(k, n - 1))
     return {
-        "count": len(values),
-        "avg_ms": sum(values) / len(values),
+        "count": n,
+        "avg_ms": sum(arr) / n,
         "median_ms": median,
-        "p95_ms": p95(values),
-        "min_ms": min(values),
-        "max_ms": max(values),
+        "p95_ms": float(arr[k]),
+        "min_ms": arr[0],
+        "max_ms": arr[-1],
     }
 
 
-def bucket_histogram(values: List[int]) -> Dict[str, int]:
-    # Log-spaced-ish buckets in ms
-    buckets = [10, 20, 50, 100, 200, 300, 500, 800, 1000, 1500, 2000, 3000, 5000, 8000]
-    hist: Dict[str, int] = Counter()
+def bucket_histogram(values: Sequence[int]) -> Dict[str, int]:
+    # bisect_left finds the first bucket with v <= b in C instead of a Python scan
+    counts = [0] * len(_BUCKET_LABELS)
     for v in values:
-        placed = False
-        for b in buckets:
-            if v <= b:
-                hist[f"<= {b}ms"] += 1
-                placed = True
-                break
-        if not placed:
-            hist["> 8000ms"] += 1
-    return dict(hist)
+        counts[bisect_left(_BUCKETS, v)] += 1
+    return {label: c for label, c in zip(_BUCKET_LABELS, counts) if c}
 
 
 def base_url_of(url: str) -> str:
+    # URLs differ only by their trailing CID, so cache on everything up to the last "/"
+    end = len(url)
+    for sep in ("?", "#"):
+        i = url.find(sep, 0, end)
+        if i != -1:
+            end = i
+    slash = url.rfind("/", 0, end)
+    if slash > url.find("://") + 2:
+        return _base_url_of_prefix(url[:slash + 1])
+    return _base_url_of_prefix(url[:end])
+
+
+@lru_cache(maxsize=2048)
+def _base_url_of_prefix(url: str) -> str:
     parts = urlsplit(url)
     path = parts.path or "/"
     if "/" in path:
@@ -85,14 +149,12 @@ def base_url_of(url: str) -> str:
 
 
 def analyze(path: str) -> dict:
-    per_gateway_times: Dict[str, List[int]] = defaultdict(list)
-    per_cid_records: Dict[str, List[Tuple[str, int]]] = defaultdict(list)  # cid -> [(gateway, elapsed_ms)]
+    # packed 4-byte ints instead of boxed Python ints: ~7x less memory per sample
+    per_gateway_times: Dict[str, array] = {}
+    cid_best: Dict[str, Tuple[int, str, bool]] = {}  # cid -> (best elapsed_ms, gateway, tied)
     per_gateway_total: Counter[str] = Counter()
 
-    for line in read_lines(path):
-        if '"event": "gateway_fetch"' not in line:
-            continue
-        obj = parse_json_after_bracket(line)
+    for obj in iter_gateway_fetch(path):
         if not obj:
             continue
         cid = obj.get("cid")
@@ -106,8 +168,16 @@ def analyze(path: str) -> dict:
         per_gateway_total[gateway] += 1
         # include only successful responses by default; count non-2xx separately
         if 200 <= int(status) < 300:
-            per_gateway_times[gateway].append(elapsed)
-            per_cid_records[cid].append((gateway, elapsed))
+            times = per_gateway_times.get(gateway)
+            if times is None:
+                times = per_gateway_times[gateway] = array("i")
+            times.append(elapsed)
+            # fastest-wins is tracked online: O(unique CIDs) memory, no second pass
+            best = cid_best.get(cid)
+            if best is None or elapsed < best[0]:
+                cid_best[cid] = (elapsed, gateway, False)
+            elif elapsed == best[0] and not best[2]:
+                cid_best[cid] = (best[0], best[1], True)
 
     # compute stats per gateway
     gateway_stats = {gw: human_stats(times) for gw, times in per_gateway_times.items()}
@@ -115,15 +185,11 @@ def analyze(path: str) -> dict:
     # fastest wins per CID
     wins: Counter[str] = Counter()
     ties: int = 0
-    for cid, items in per_cid_records.items():
-        if not items:
-            continue
-        best_time = min(t for _, t in items)
-        winners = [gw for gw, t in items if t == best_time]
-        if len(winners) == 1:
-            wins[winners[0]] += 1
-        else:
+    for _, best_gw, tie in cid_best.values():
+        if tie:
             ties += 1
+        else:
+            wins[best_gw] += 1
 
     # histograms per gateway
     gateway_hists = {gw: bucket_histogram(times) for gw, times in per_gateway_times.items()}
@@ -162,8 +228,13 @@ def format_report(result: dict) -> str:
     wins: Dict[str, int] = result.get("fastest_wins", {})
     totals: Dict[str, int] = result.get("gateway_total_attempts", {})
 
-    # Order gateways by average latency
-    order = sorted(gateway_stats.keys(), key=lambda gw: (math.inf if math.isnan(gateway_stats[gw]["avg_ms"]) else gateway_stats[gw]["avg_ms"]))
+    # Order gateways by average latency; keys are extracted once, index keeps ties stable
+    keyed = []
+    for i, (gw, stats) in enumerate(gateway_stats.items()):
+        avg = stats["avg_ms"]
+        keyed.append((math.inf if math.isnan(avg) else avg, i, gw))
+    keyed.sort()
+    order = [gw for _, _, gw in keyed]
 
     lines: List[str] = []
     lines.append("网关性能报告\n")
@@ -189,21 +260,10 @@ def format_report(result: dict) -> str:
         hist = histograms.get(gw, {})
         if hist:
             lines.append("  耗时分布:")
-            # stable order by bucket upper bound
-            def bucket_key(k: str) -> Tuple[int, int]:
-                if k.startswith("<= ") and k.endswith("ms"):
-                    try:
-                        return (0, int(k[3:-2]))
-                    except Exception:
-                        return (0, 10**9)
-                if k.startswith("> ") and k.endswith("ms"):
-                    try:
-                        return (1, int(k[2:-2]))
-                    except Exception:
-                        return (1, 10**9)
-                return (2, 10**9)
-            for bucket in sorted(hist.keys(), key=bucket_key):
-                lines.append(f"    {bucket}: {hist[bucket]}")
+            # bucket labels are already in upper-bound order
+            for bucket in _BUCKET_LABELS:
+                if bucket in hist:
+                    lines.append(f"    {bucket}: {hist[bucket]}")
         lines.append("")
 
     # Notes
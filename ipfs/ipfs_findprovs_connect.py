@@ -1,13 +1,31 @@
 #!/usr/bin/env python3
 import argparse
 import csv
-import json
+import http.client
 import logging
 import os
-import subprocess
+import shelve
+import socket
 import sys
+import threading
 import time
-from typing import Iterable, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
+from urllib.parse import quote
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+
+IPFS_API_HOST = "127.0.0.1"
+IPFS_API_PORT = 5001
+IPFS_API_TIMEOUT_SEC = 30
+
+# http.client connections are not thread-safe, so each worker thread keeps its own
+_local = threading.local()
 
 
 def configure_logging(verbose: bool) -> None:
@@ -15,33 +33,63 @@ def configure_logging(verbose: bool) -> None:
     logging.basicConfig(level=level, format="%(asctime)s | %(levelname)s | %(message)s")
 
 
-def run_ipfs_api(endpoint: str, arg: str) -> Dict[str, Any]:
-    # Uses curl to call IPFS HTTP API to avoid requiring python lib
-    url = f"http://127.0.0.1:5001/api/v0/{endpoint}?arg={arg}"
-    proc = subprocess.run([
-        "curl", "-sS", "--max-time", "30", url
-    ], capture_output=True, text=True)
-    if proc.returncode != 0:
-        raise RuntimeError(f"curl failed: {proc.returncode}, stderr={proc.stderr.strip()}")
-    text = proc.stdout.strip()
-    # Some endpoints stream ndjson; split lines and parse last stateful object and merge
-    objects: List[Dict[str, Any]] = []
-    for line in text.splitlines():
-        if not line:
-            continue
-        try:
-            objects.append(json.loads(line))
-        except json.JSONDecodeError:
-            logging.debug("Non-JSON line: %s", line)
-            continue
-    return {"_raw": text, "objects": objects}
+def api_connection() -> http.client.HTTPConnection:
+    # One keep-alive connection per thread to the local IPFS HTTP API, reused across calls
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = http.client.HTTPConnection(IPFS_API_HOST, IPFS_API_PORT, timeout=IPFS_API_TIMEOUT_SEC)
+    return conn
+
+
+def api_request(endpoint: str, arg: str, timeout: float) -> http.client.HTTPResponse:
+    path = f"/api/v0/{endpoint}?arg={quote(arg, safe='')}"
+    conn = api_connection()
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    try:
+        conn.request("POST", path)
+        return conn.getresponse()
+    except (http.client.HTTPException, ConnectionError):
+        # The daemon may have dropped the idle connection; retry once on a fresh one
+        conn.close()
+        conn.request("POST", path)
+        return conn.getresponse()
+
+
+def api_post(endpoint: str, arg: str, timeout: float = IPFS_API_TIMEOUT_SEC) -> Tuple[int, bytes]:
+    try:
+        resp = api_request(endpoint, arg, timeout)
+        return resp.status, resp.read()
+    except socket.timeout:
+        # A response may still arrive later, so this connection cannot be reused
+        api_connection().close()
+        raise
+
+
+def iter_api_objects(endpoint: str, arg: str) -> Iterator[Dict[str, Any]]:
+    # Streaming endpoints answer with ndjson; decode each object as its line arrives
+    try:
+        resp = api_request(endpoint, arg, IPFS_API_TIMEOUT_SEC)
+        if resp.status != 200:
+            raise RuntimeError(f"IPFS API {endpoint} failed: {resp.status}, body={resp.read()[:300]!r}")
+        for line in resp:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield _json.loads(line)
+            except ValueError:
+                logging.debug("Non-JSON line: %r", line)
+    except socket.timeout:
+        api_connection().close()
+        raise
 
 
 def dht_findprovs(cid: str) -> List[Dict[str, Any]]:
     # IPFS HTTP API: /api/v0/dht/findprovs?arg=<cid>
-    result = run_ipfs_api("dht/findprovs", cid)
     providers: List[Dict[str, Any]] = []
-    for obj in result["objects"]:
+    for obj in iter_api_objects("dht/findprovs", cid):
         # Expect records like { "Type": <int>, "Responses": [{"ID": "peer", "Addrs": ["/ip4/.../p2p/<peer>"]}], ... }
         if "Responses" in obj and isinstance(obj["Responses"], list):
             for resp in obj["Responses"]:
@@ -54,16 +102,38 @@ def dht_findprovs(cid: str) -> List[Dict[str, Any]]:
     return providers
 
 
+class ProviderCache:
+    # On-disk cid -> (fetched_at, providers) so reruns over the same CSV skip the DHT query
+    def __init__(self, path: str, ttl_sec: float) -> None:
+        self.ttl_sec = ttl_sec
+        self._db = shelve.open(path)
+        self._lock = threading.Lock()  # shelve is not safe for concurrent access
+
+    def get(self, cid: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._db.get(cid)
+        if entry and time.time() - entry[0] < self.ttl_sec:
+            return entry[1]
+        return None
+
+    def put(self, cid: str, providers: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._db[cid] = (time.time(), providers)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
 def swarm_connect(addr: str, timeout_sec: int = 20) -> bool:
-    # IPFS CLI is convenient for connect and has built-in retries
-    proc = subprocess.run([
-        "ipfs", "swarm", "connect", addr
-    ], capture_output=True, text=True, timeout=timeout_sec)
-    success = proc.returncode == 0
+    # Same keep-alive API connection as findprovs; no ipfs CLI process per attempt
+    status, body = api_post("swarm/connect", addr, timeout=timeout_sec)
+    text = body.decode("utf-8", errors="replace").strip()
+    success = status == 200
     if success:
-        logging.info("Connected: %s | %s", addr, proc.stdout.strip())
+        logging.info("Connected: %s | %s", addr, text)
     else:
-        logging.warning("Connect failed: %s | %s %s", addr, proc.stdout.strip(), proc.stderr.strip())
+        logging.warning("Connect failed: %s | %s %s", addr, status, text)
     return success
 
 
@@ -79,11 +149,72 @@ def read_cids_from_csv(csv_path: str) -> List[str]:
     return cids
 
 
+def connect_providers(cid: str, top: int, sleep: float, cache: Optional[ProviderCache] = None) -> Tuple[int, int]:
+    # Returns (attempts, successes) for one CID; runs on a worker thread
+    total_attempts = 0
+    total_success = 0
+
+    logging.info("Finding providers for CID: %s", cid)
+    providers = cache.get(cid) if cache else None
+    if providers is not None:
+        logging.debug("Using cached providers for %s", cid)
+    else:
+        try:
+            providers = dht_findprovs(cid)
+        except Exception as exc:
+            logging.error("findprovs failed for %s: %s", cid, exc)
+            return 0, 0
+        # Empty answers are usually transient, so only cache real hits
+        if cache and providers:
+            cache.put(cid, providers)
+
+    logging.info("Found %d provider entries for CID %s", len(providers), cid)
+
+    # Deduplicate providers by peer id, keeping first-seen order and merging
+    # the addrs of later sightings instead of overwriting them
+    dedup: Dict[str, Dict[str, Any]] = {}
+    for p in providers:
+        merged = dedup.setdefault(p["peer_id"], {"peer_id": p["peer_id"], "addrs": []})
+        merged["addrs"].extend(a for a in p["addrs"] if a not in merged["addrs"])
+    top_providers = list(islice(dedup.values(), max(top, 0)))
+    logging.info("Connecting to top %d providers for %s", len(top_providers), cid)
+
+    for p in top_providers:
+        peer_id = p["peer_id"]
+        addrs: List[str] = p.get("addrs") or []
+        if not addrs:
+            logging.debug("No addrs for %s", peer_id)
+            continue
+        for addr in addrs:
+            # Ensure multiaddr contains peer id suffix; if not, append /p2p/peer
+            if f"/p2p/{peer_id}" not in addr and f"/ipfs/{peer_id}" not in addr:
+                candidate = addr.rstrip("/") + f"/p2p/{peer_id}"
+            else:
+                candidate = addr
+            total_attempts += 1
+            ok = False
+            try:
+                ok = swarm_connect(candidate)
+            except socket.timeout:
+                logging.warning("Connect timeout: %s", candidate)
+            except Exception as exc:
+                logging.warning("Connect error %s: %s", candidate, exc)
+            if ok:
+                total_success += 1
+                break
+        if sleep > 0:
+            time.sleep(sleep)
+    return total_attempts, total_success
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Find providers via IPFS API and connect to top X")
     parser.add_argument("--csv", default="cids.csv", help="CSV file with 'cid' header (default: cids.csv)")
     parser.add_argument("--top", type=int, default=5, help="Top X providers to connect to per CID")
     parser.add_argument("--sleep", type=float, default=0.0, help="Seconds to sleep between connects")
+    parser.add_argument("--workers", type=int, default=16, help="CIDs processed concurrently (default: 16)")
+    parser.add_argument("--cache", default=".findprovs_cache", help="Provider cache file (default: .findprovs_cache)")
+    parser.add_argument("--cache-ttl", type=float, default=3600.0, help="Seconds a cached provider list stays valid; 0 disables the cache")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable debug logging")
     args = parser.parse_args()
 
@@ -100,48 +231,23 @@ def main() -> None:
     total_attempts = 0
     total_success = 0
 
-    for cid in cids:
-        logging.info("Finding providers for CID: %s", cid)
-        try:
-            providers = dht_findprovs(cid)
-        except Exception as exc:
-            logging.error("findprovs failed for %s: %s", cid, exc)
-            continue
-
-        logging.info("Found %d provider entries for CID %s", len(providers), cid)
-
-        # Deduplicate providers by peer id
-        dedup: Dict[str, Dict[str, Any]] = {}
-        for p in providers:
-            dedup[p["peer_id"]] = p
-        top_providers = list(dedup.values())[: max(args.top, 0)]
-        logging.info("Connecting to top %d providers for %s", len(top_providers), cid)
+    cache = ProviderCache(args.cache, args.cache_ttl) if args.cache_ttl > 0 else None
 
-        for p in top_providers:
-            peer_id = p["peer_id"]
-            addrs: List[str] = p.get("addrs") or []
-            if not addrs:
-                logging.debug("No addrs for %s", peer_id)
-                continue
-            for addr in addrs:
-                # Ensure multiaddr contains peer id suffix; if not, append /p2p/peer
-                if f"/p2p/{peer_id}" not in addr and f"/ipfs/{peer_id}" not in addr:
-                    candidate = addr.rstrip("/") + f"/p2p/{peer_id}"
-                else:
-                    candidate = addr
-                total_attempts += 1
-                ok = False
+    # Each CID is an independent chain of blocking API round-trips, so overlap them
+    try:
+        with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as pool:
+            futures = {pool.submit(connect_providers, cid, args.top, args.sleep, cache): cid for cid in cids}
+            for fut in as_completed(futures):
                 try:
-                    ok = swarm_connect(candidate)
-                except subprocess.TimeoutExpired:
-                    logging.warning("Connect timeout: %s", candidate)
+                    attempts, success = fut.result()
                 except Exception as exc:
-                    logging.warning("Connect error %s: %s", candidate, exc)
-                if ok:
-                    total_success += 1
-                    break
-            if args.sleep > 0:
-                time.sleep(args.sleep)
+                    logging.error("Processing failed for %s: %s", futures[fut], exc)
+                    continue
+                total_attempts += attempts
+                total_success += success
+    finally:
+        if cache:
+            cache.close()
 
     logging.info("Done. Attempts=%d Success=%d", total_attempts, total_success)
 
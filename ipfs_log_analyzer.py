@@ -6,144 +6,308 @@ IPFS Gateway Performance Log Analyzer
 提供网关性能对比、时序分析、win rate计算等功能。
 """
 
-import json
-import re
+import calendar
+import io
+import math
+import mmap
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from collections import defaultdict, Counter
-from typing import Dict, List, Tuple, Optional
-import statistics
+from itertools import repeat
+from typing import Dict, Iterable, List, Sequence, TextIO, Tuple
 import argparse
+from array import array
+from bisect import bisect_right
 
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
 
-class IPFSLogEntry:
-    """IPFS日志条目数据结构"""
-    
-    def __init__(self, timestamp: str, data: dict):
-        self.timestamp = timestamp
-        self.data = data
-        self.bytes = data.get('bytes', 0)
-        self.elapsed_ms = data.get('elapsed_ms', 0)
-        self.gateway = data.get('gateway', '')
-        self.speed_kbps = data.get('speed_kbps', 0)
-        self.mint = data.get('mint', '')
-        self.subject = data.get('subject', '')
-        
-    @property
-    def datetime(self) -> datetime:
-        """解析时间戳为datetime对象"""
+from stats_utils import int_stdev
+
+
+# 字节级预过滤：只有包含该事件名的行才进入解析
+PULL_DONE_MARKER = b'ipfs_pull_done'
+# 日志文件读缓冲大小（默认 8KB 对逐行扫描大文件偏小）
+LOG_READ_BUFFER_SIZE = 64 * 1024
+# 每个进程至少分到的字节数；再小的话进程启动开销超过并行收益
+MIN_CHUNK_BYTES = 4 << 20
+
+# 定义耗时区间 (毫秒)
+LATENCY_BUCKETS = [
+    ('0-100ms', 0, 100),
+    ('100-500ms', 100, 500),
+    ('500-2000ms', 500, 2000),
+    ('2000ms+', 2000, float('inf'))
+]
+# 各区间下界，供 bisect_right 定位（下标 0 为负值，不计入任何区间）
+LATENCY_BUCKET_EDGES = [min_val for _, min_val, _ in LATENCY_BUCKETS]
+
+# 报告中按网关重复的段落模板，用 format_map 一次填充
+GATEWAY_SUMMARY_TEMPLATE = (
+    "网关: {gateway}\n"
+    "  请求数: {total_requests}\n"
+    "  平均耗时: {avg_elapsed_ms:.1f} ms\n"
+    "  中位耗时: {median_elapsed_ms:.1f} ms\n"
+    "  耗时范围: {min_elapsed_ms} - {max_elapsed_ms} ms\n"
+    "  标准差: {std_elapsed_ms:.1f} ms\n"
+    "  平均速度: {avg_speed_kbps:.1f} KB/s\n"
+    "  总数据量: {total_data_mb:.2f} MB\n"
+    "  耗时分布:"
+)
+LATENCY_BUCKET_TEMPLATE = "    {bucket_name}: {count}次 ({percentage:.1f}%)"
+WIN_RATE_TEMPLATE = (
+    "网关: {gateway}\n"
+    "  获胜次数: {wins} / {participations}\n"
+    "  Win Rate: {win_percentage:.1f}%\n"
+)
+HOURLY_ROW_TEMPLATE = "  {gateway}: {count}次, 平均{avg_ms:.1f}ms"
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """解析时间戳为datetime对象"""
+    try:
+        return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f")
+    except ValueError:
+        try:
+            return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return datetime.now()
+
+
+def timestamp_to_ms(timestamp: str) -> int:
+    """把时间戳转换为毫秒整数（按 UTC 解释，仅用于排序和按小时分组）"""
+    # 固定格式 "YYYY-MM-DD HH:MM:SS.fff" 直接按位置切片，避开 strptime
+    if len(timestamp) == 23 and timestamp[19] == '.':
         try:
-            return datetime.strptime(self.timestamp, "%Y-%m-%d %H:%M:%S.%f")
+            return calendar.timegm((
+                int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]),
+                0, 0, 0)) * 1000 + int(timestamp[20:23])
         except ValueError:
-            try:
-                return datetime.strptime(self.timestamp, "%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                return datetime.now()
+            pass
+    dt = parse_timestamp(timestamp)
+    return calendar.timegm(dt.timetuple()) * 1000 + dt.microsecond // 1000
+
+
+def sorted_median(values: Sequence[float]) -> float:
+    """已排序序列的中位数（偶数个取中间两数均值，同 statistics.median）"""
+    n = len(values)
+    mid = n // 2
+    if n % 2 == 1:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2
+
+
+def chunk_ranges(file_path: str, jobs: int) -> List[Tuple[int, int]]:
+    """把文件按字节切成约 jobs 段，每段都在换行符之后结束"""
+    size = os.path.getsize(file_path)
+    step = max(size // max(jobs, 1), MIN_CHUNK_BYTES)
+    ranges = []
+    with open(file_path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + step, size))
+            f.readline()  # 丢弃半行，让边界落在行尾
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def iter_marked_lines(mm: mmap.mmap, start: int, end: int) -> Iterable[bytes]:
+    """在映射内存的 [start, end) 中直接查找事件名，只切出包含它的行（不含换行符）"""
+    find = mm.find
+    rfind = mm.rfind
+    while True:
+        pos = find(PULL_DONE_MARKER, start, end)
+        if pos == -1:
+            return
+        line_start = rfind(b'\n', start, pos) + 1 or start
+        line_end = find(b'\n', pos, end)
+        if line_end == -1:
+            line_end = end
+        yield mm[line_start:line_end]
+        start = line_end + 1
+
+
+def parse_chunk(file_path: str, start: int, end: int) -> tuple:
+    """在子进程中解析 [start, end) 字节范围，返回该段的列数据"""
+    analyzer = IPFSLogAnalyzer()
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        analyzer.load_lines(iter_marked_lines(mm, start, end))
+    return analyzer.columns()
 
 
 class IPFSLogAnalyzer:
     """IPFS日志分析器"""
     
     def __init__(self):
-        self.entries: List[IPFSLogEntry] = []
+        # 列式存储（SoA）：每个字段一个紧凑数组，第 i 条记录分布在各列的下标 i 处，
+        # 不再为每条日志创建一个 Python 对象
+        self.timestamps: List[str] = []
+        self.timestamp_ms = array('q')
+        self.elapsed_ms = array('q')
+        self.bytes = array('q')
+        self.speed_kbps = array('d')
+        self.gateway_ids = array('i')
+        # 网关按首次出现顺序编码
+        self.gateways: List[str] = []
+        self.gateway_index: Dict[str, int] = {}
         self.gateway_stats: Dict[str, dict] = defaultdict(lambda: {
             'total_requests': 0,
             'total_bytes': 0,
             'total_elapsed_ms': 0,
-            'elapsed_times': [],
-            'speeds': [],
-            'file_sizes': []
+            'elapsed_squares': 0,  # 耗时平方和（精确整数），供标准差使用
+            'elapsed_times': array('q'),
+            'speeds': array('d'),
+            # 耗时区间计数，下标与 bisect_right(LATENCY_BUCKET_EDGES, t) 对应
+            'latency_buckets': [0] * (len(LATENCY_BUCKET_EDGES) + 1)
         })
         
-    def parse_log_line(self, line: str) -> Optional[IPFSLogEntry]:
-        """解析单行日志"""
+    def __len__(self) -> int:
+        return len(self.elapsed_ms)
+        
+    def columns(self) -> tuple:
+        """导出列数据（跨进程传递用）"""
+        return (self.timestamps, self.timestamp_ms, self.elapsed_ms, self.bytes,
+                self.speed_kbps, self.gateway_ids, self.gateways)
+    
+    def merge_columns(self, columns: tuple):
+        """追加另一段的列数据，并把其网关编码映射到本实例的编码"""
+        timestamps, timestamp_ms, elapsed_ms, sizes, speed_kbps, gateway_ids, gateways = columns
+        remap = []
+        for gateway in gateways:
+            gateway_id = self.gateway_index.get(gateway)
+            if gateway_id is None:
+                gateway_id = self.gateway_index[gateway] = len(self.gateways)
+                self.gateways.append(gateway)
+            remap.append(gateway_id)
+        self.timestamps.extend(timestamps)
+        self.timestamp_ms.extend(timestamp_ms)
+        self.elapsed_ms.extend(elapsed_ms)
+        self.bytes.extend(sizes)
+        self.speed_kbps.extend(speed_kbps)
+        self.gateway_ids.extend(remap[g] for g in gateway_ids)
+        
+    def _append_row(self, timestamp: str, data: dict):
+        """把一条 ipfs_pull_done 记录追加到各列"""
+        gateway = data.get('gateway', '')
+        gateway_id = self.gateway_index.get(gateway)
+        if gateway_id is None:
+            gateway_id = self.gateway_index[gateway] = len(self.gateways)
+            self.gateways.append(gateway)
+        self.timestamps.append(timestamp)
+        self.timestamp_ms.append(timestamp_to_ms(timestamp))
+        self.elapsed_ms.append(int(data.get('elapsed_ms') or 0))
+        self.bytes.append(int(data.get('bytes') or 0))
+        self.speed_kbps.append(float(data.get('speed_kbps') or 0))
+        self.gateway_ids.append(gateway_id)
+        
+    def parse_log_line(self, line: bytes) -> bool:
+        """解析单行日志（原始字节，无需先解码），是 ipfs_pull_done 记录则追加并返回 True"""
         line = line.strip()
         if not line:
-            return None
+            return False
             
         # 处理Docker日志格式，移除容器前缀
         # 格式: rs-subscriber  | [2025-09-19 01:05:52.073] {"bytes":115303,"elapsed_ms":1154,...}
         # 或者: [2025-09-19 01:05:52.073] {"bytes":115303,"elapsed_ms":1154,...}
         
-        # 移除Docker容器前缀（如果存在）
-        docker_prefix_pattern = r'^[^|]*\|\s*'
-        line = re.sub(docker_prefix_pattern, '', line)
-        
-        # 提取时间戳和JSON数据
-        match = re.match(r'\[([^\]]+)\]\s*(.+)', line)
-        if not match:
-            return None
+        # 移除Docker容器前缀（如果存在）：'|' 之前没有 '[' 才视为前缀
+        bar = line.find(b'|')
+        if bar != -1 and line.find(b'[', 0, bar) == -1:
+            line = line[bar + 1:].lstrip()
+        
+        # 提取时间戳和JSON数据（用 find 切片代替正则）
+        if not line.startswith(b'['):
+            return False
+        rb = line.find(b']')
+        if rb <= 1:
+            return False
             
-        timestamp_str = match.group(1)
-        json_str = match.group(2)
+        timestamp_str = line[1:rb].decode('utf-8', errors='replace')
+        json_str = line[rb + 1:].lstrip()
+        if not json_str:
+            return False
         
         try:
-            data = json.loads(json_str)
-            # 只处理ipfs_pull_done事件
-            if data.get('event') == 'ipfs_pull_done':
-                return IPFSLogEntry(timestamp_str, data)
-        except json.JSONDecodeError:
-            pass
+            data = _json.loads(json_str)
+        except ValueError:
+            return False
+        
+        # 只处理ipfs_pull_done事件
+        if isinstance(data, dict) and data.get('event') == 'ipfs_pull_done':
+            self._append_row(timestamp_str, data)
+            return True
             
-        return None
+        return False
+    
+    def load_lines(self, lines: Iterable[bytes]):
+        """解析字节行；不含 ipfs_pull_done 的行在任何解析之前直接跳过"""
+        for line in lines:
+            if PULL_DONE_MARKER in line:
+                self.parse_log_line(line)
     
-    def load_log_file(self, file_path: str):
-        """加载日志文件"""
+    def load_log_file(self, file_path: str, jobs: int = 1):
+        """加载日志文件；大文件按行对齐的字节段分给 jobs 个进程并行解析"""
         print(f"正在加载日志文件: {file_path}")
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                entry = self.parse_log_line(line)
-                if entry:
-                    self.entries.append(entry)
+        ranges = chunk_ranges(file_path, jobs) if jobs > 1 else []
+        if len(ranges) > 1:
+            starts, ends = zip(*ranges)
+            with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+                # map 按提交顺序返回，合并后行序和网关首次出现顺序与串行解析一致
+                for columns in pool.map(parse_chunk, repeat(file_path), starts, ends):
+                    self.merge_columns(columns)
+        else:
+            with open(file_path, 'rb', buffering=LOG_READ_BUFFER_SIZE) as f:
+                try:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, OSError):
+                    # 空文件和管道无法映射，退回逐行读取
+                    self.load_lines(f)
+                else:
+                    # 由内核按需调页，其余行不会被切片或复制
+                    with mm:
+                        self.load_lines(iter_marked_lines(mm, 0, len(mm)))
                     
-        print(f"成功解析 {len(self.entries)} 条 ipfs_pull_done 记录")
+        print(f"成功解析 {len(self)} 条 ipfs_pull_done 记录")
         
     def load_log_from_stdin(self):
         """从标准输入加载日志"""
         print("正在从标准输入读取日志...")
         
-        for line_num, line in enumerate(sys.stdin, 1):
-            entry = self.parse_log_line(line)
-            if entry:
-                self.entries.append(entry)
+        self.load_lines(sys.stdin.buffer)
                 
-        print(f"成功解析 {len(self.entries)} 条 ipfs_pull_done 记录")
+        print(f"成功解析 {len(self)} 条 ipfs_pull_done 记录")
     
     def calculate_stats(self):
         """计算统计信息"""
         print("正在计算统计信息...")
         
-        for entry in self.entries:
-            gateway = entry.gateway
-            stats = self.gateway_stats[gateway]
+        for gateway_id, elapsed, size, speed in zip(self.gateway_ids, self.elapsed_ms, self.bytes, self.speed_kbps):
+            stats = self.gateway_stats[self.gateways[gateway_id]]
             
             stats['total_requests'] += 1
-            stats['total_bytes'] += entry.bytes
-            stats['total_elapsed_ms'] += entry.elapsed_ms
-            stats['elapsed_times'].append(entry.elapsed_ms)
-            stats['speeds'].append(entry.speed_kbps)
-            stats['file_sizes'].append(entry.bytes)
+            stats['total_bytes'] += size
+            stats['total_elapsed_ms'] += elapsed
+            stats['elapsed_squares'] += elapsed * elapsed
+            stats['elapsed_times'].append(elapsed)
+            stats['speeds'].append(speed)
+            # 分桶在同一遍历中完成，汇总时无需再扫描耗时数组
+            stats['latency_buckets'][bisect_right(LATENCY_BUCKET_EDGES, elapsed)] += 1
     
-    def calculate_latency_distribution(self, elapsed_times: List[int]) -> Dict[str, dict]:
-        """计算耗时分布统计"""
-        # 定义耗时区间 (毫秒)
-        buckets = [
-            ('0-100ms', 0, 100),
-            ('100-500ms', 100, 500),
-            ('500-2000ms', 500, 2000),
-            ('2000ms+', 2000, float('inf'))
-        ]
-        
+    @staticmethod
+    def latency_distribution_from_counts(counts: Sequence[int], total_count: int) -> Dict[str, dict]:
+        """由区间计数生成耗时分布统计"""
         distribution = {}
-        total_count = len(elapsed_times)
         
-        for bucket_name, min_val, max_val in buckets:
-            if max_val == float('inf'):
-                count = sum(1 for t in elapsed_times if t >= min_val)
-            else:
-                count = sum(1 for t in elapsed_times if min_val <= t < max_val)
-            
+        for (bucket_name, min_val, max_val), count in zip(LATENCY_BUCKETS, counts[1:]):
             percentage = (count / total_count * 100) if total_count > 0 else 0
             
             distribution[bucket_name] = {
@@ -164,146 +328,158 @@ class IPFSLogAnalyzer:
                 
             elapsed_times = stats['elapsed_times']
             speeds = stats['speeds']
-            file_sizes = stats['file_sizes']
+            count = stats['total_requests']
+            # 每列只排序一次，中位数、最小值、最大值都从排序结果读取
+            sorted_elapsed = sorted(elapsed_times)
             
             # 计算耗时分布
-            latency_distribution = self.calculate_latency_distribution(elapsed_times)
+            latency_distribution = self.latency_distribution_from_counts(
+                stats['latency_buckets'], count)
             
             summary[gateway] = {
-                'total_requests': stats['total_requests'],
+                'total_requests': count,
                 'total_bytes': stats['total_bytes'],
-                'avg_elapsed_ms': stats['total_elapsed_ms'] / stats['total_requests'],
-                'median_elapsed_ms': statistics.median(elapsed_times),
-                'min_elapsed_ms': min(elapsed_times),
-                'max_elapsed_ms': max(elapsed_times),
-                'std_elapsed_ms': statistics.stdev(elapsed_times) if len(elapsed_times) > 1 else 0,
-                'avg_speed_kbps': statistics.mean(speeds),
-                'median_speed_kbps': statistics.median(speeds),
-                'avg_file_size_bytes': statistics.mean(file_sizes),
+                'avg_elapsed_ms': stats['total_elapsed_ms'] / count,
+                'median_elapsed_ms': sorted_median(sorted_elapsed),
+                'min_elapsed_ms': sorted_elapsed[0],
+                'max_elapsed_ms': sorted_elapsed[-1],
+                'std_elapsed_ms': int_stdev(count, stats['total_elapsed_ms'], stats['elapsed_squares']) if count > 1 else 0,
+                'avg_speed_kbps': math.fsum(speeds) / count,
+                'median_speed_kbps': sorted_median(sorted(speeds)),
+                'avg_file_size_bytes': stats['total_bytes'] / count,
                 'total_data_mb': stats['total_bytes'] / (1024 * 1024),
                 'latency_distribution': latency_distribution
             }
             
         return summary
     
-    def calculate_win_rates(self) -> Dict[str, dict]:
-        """计算网关win rate（比其他网关快的次数）"""
+    def _analyze_files(self) -> Tuple[Dict[str, dict], dict]:
+        """一次遍历文件分组，同时得到网关win rate和最优网关场景"""
         print("正在计算网关win rate...")
         
-        # 按文件大小分组（相同大小认为是同一个文件）
-        file_groups = defaultdict(list)
-        for entry in self.entries:
-            file_key = f"bytes_{entry.bytes}"
-            file_groups[file_key].append(entry)
+        # 按文件大小分组（相同大小认为是同一个文件），直接以整数大小为键；
+        # 每组只保留累加量：[最快耗时, 最快网关, 总耗时, 行数, 参与网关集合]，
+        # 一次遍历行即可求出组内最小值，不再保存行号列表
+        file_groups = {}
+        for size, elapsed, gateway_id in zip(self.bytes, self.elapsed_ms, self.gateway_ids):
+            group = file_groups.get(size)
+            if group is None:
+                file_groups[size] = [elapsed, gateway_id, elapsed, 1, {gateway_id}]
+                continue
+            if elapsed < group[0]:
+                group[0] = elapsed
+                group[1] = gateway_id
+            group[2] += elapsed
+            group[3] += 1
+            group[4].add(gateway_id)
         
         gateway_wins = Counter()
         gateway_participations = Counter()
-        comparison_count = 0
+        files_analyzed = 0
+        total_optimal_time = 0
+        total_actual_time = 0
         
-        for file_key, entries in file_groups.items():
-            if len(entries) < 2:  # 需要至少2个网关的数据才能比较
+        for fastest_elapsed, fastest_gateway, group_total, row_count, gateways_in_comparison in file_groups.values():
+            if row_count < 2:  # 需要至少2个网关的数据才能比较
                 continue
                 
-            # 找出最快的网关
-            fastest_entry = min(entries, key=lambda x: x.elapsed_ms)
-            fastest_gateway = fastest_entry.gateway
+            total_optimal_time += fastest_elapsed
+            total_actual_time += group_total
             
             # 记录参与比较的网关
-            gateways_in_comparison = set(entry.gateway for entry in entries)
-            for gateway in gateways_in_comparison:
-                gateway_participations[gateway] += 1
+            gateway_participations.update(gateways_in_comparison)
             
-            # 记录获胜
+            # 记录获胜（同时也是最优场景下选中的网关）
             gateway_wins[fastest_gateway] += 1
-            comparison_count += 1
+            files_analyzed += 1
         
         # 计算win rate
         win_rates = {}
-        for gateway in gateway_participations:
-            wins = gateway_wins.get(gateway, 0)
-            participations = gateway_participations[gateway]
+        for gateway_id in gateway_participations:
+            wins = gateway_wins.get(gateway_id, 0)
+            participations = gateway_participations[gateway_id]
             win_rate = wins / participations if participations > 0 else 0
             
-            win_rates[gateway] = {
+            win_rates[self.gateways[gateway_id]] = {
                 'wins': wins,
                 'participations': participations,
                 'win_rate': win_rate,
                 'win_percentage': win_rate * 100
             }
         
-        print(f"分析了 {comparison_count} 个文件的网关对比")
-        return win_rates
-    
-    def simulate_best_gateway_scenario(self) -> dict:
-        """模拟总是使用最快网关的场景"""
+        print(f"分析了 {files_analyzed} 个文件的网关对比")
         print("正在模拟最优网关选择场景...")
         
-        # 按文件大小分组（相同大小认为是同一个文件）
-        file_groups = defaultdict(list)
-        for entry in self.entries:
-            file_key = f"bytes_{entry.bytes}"
-            file_groups[file_key].append(entry)
-        
-        total_optimal_time = 0
-        total_actual_time = 0
-        optimal_selections = Counter()
-        files_analyzed = 0
-        
-        for file_key, entries in file_groups.items():
-            if len(entries) < 2:
-                continue
-                
-            # 找出最快和实际耗时
-            fastest_entry = min(entries, key=lambda x: x.elapsed_ms)
-            actual_total_time = sum(entry.elapsed_ms for entry in entries)
-            
-            total_optimal_time += fastest_entry.elapsed_ms
-            total_actual_time += actual_total_time
-            optimal_selections[fastest_entry.gateway] += 1
-            files_analyzed += 1
-        
         time_saved = total_actual_time - total_optimal_time
         efficiency_gain = (time_saved / total_actual_time * 100) if total_actual_time > 0 else 0
         
-        return {
+        optimal_scenario = {
             'files_analyzed': files_analyzed,
             'total_optimal_time_ms': total_optimal_time,
             'total_actual_time_ms': total_actual_time,
             'time_saved_ms': time_saved,
             'efficiency_gain_percentage': efficiency_gain,
-            'optimal_gateway_selections': dict(optimal_selections),
+            'optimal_gateway_selections': {self.gateways[g]: c for g, c in gateway_wins.items()},
             'avg_optimal_time_per_file_ms': total_optimal_time / files_analyzed if files_analyzed > 0 else 0,
             'avg_actual_time_per_file_ms': total_actual_time / files_analyzed if files_analyzed > 0 else 0
         }
+        return win_rates, optimal_scenario
+    
+    def calculate_win_rates(self) -> Dict[str, dict]:
+        """计算网关win rate（比其他网关快的次数）"""
+        return self._analyze_files()[0]
+    
+    def simulate_best_gateway_scenario(self) -> dict:
+        """模拟总是使用最快网关的场景"""
+        return self._analyze_files()[1]
     
     def analyze_time_series(self) -> dict:
         """分析时序上的耗时变化"""
         print("正在分析时序变化...")
         
-        # 按时间排序
-        sorted_entries = sorted(self.entries, key=lambda x: x.datetime)
-        
-        if len(sorted_entries) < 2:
+        timestamp_ms = self.timestamp_ms
+        if len(timestamp_ms) < 2:
             return {}
         
-        # 按小时分组分析
-        hourly_stats = defaultdict(lambda: defaultdict(list))
-        
-        for entry in sorted_entries:
-            hour_key = entry.datetime.strftime("%Y-%m-%d %H:00")
-            hourly_stats[hour_key][entry.gateway].append(entry.elapsed_ms)
+        # 按整数小时编号分组，一次遍历、不对行排序：
+        # 每组记录 [组内最早时间戳, 其行号, 耗时数组]，最早时间戳用于还原按时间排序后的网关顺序
+        hourly_rows = {}
+        for i, (ms, gateway_id, elapsed) in enumerate(zip(timestamp_ms, self.gateway_ids, self.elapsed_ms)):
+            hour = ms // 3_600_000
+            gateways = hourly_rows.get(hour)
+            if gateways is None:
+                gateways = hourly_rows[hour] = {}
+            group = gateways.get(gateway_id)
+            if group is None:
+                gateways[gateway_id] = [ms, i, array('q', (elapsed,))]
+                continue
+            if ms < group[0]:
+                group[0] = ms
+                group[1] = i
+            group[2].append(elapsed)
+        
+        # 只对小时编号和组内网关排序；小时标签每小时只格式化一次
+        hourly_stats = {}
+        for hour in sorted(hourly_rows):
+            gateways = hourly_rows[hour]
+            hour_key = time.strftime("%Y-%m-%d %H:00", time.gmtime(hour * 3600))
+            hourly_stats[hour_key] = {
+                self.gateways[gateway_id]: gateways[gateway_id][2]
+                for gateway_id in sorted(gateways, key=lambda g: gateways[g][:2])
+            }
         
         # 计算每小时的统计
         time_series = {}
         for hour, gateways in hourly_stats.items():
             hour_stats = {}
             for gateway, times in gateways.items():
+                sorted_times = sorted(times)
                 hour_stats[gateway] = {
                     'count': len(times),
-                    'avg_ms': statistics.mean(times),
-                    'median_ms': statistics.median(times),
-                    'min_ms': min(times),
-                    'max_ms': max(times)
+                    'avg_ms': sum(times) / len(times),
+                    'median_ms': sorted_median(sorted_times),
+                    'min_ms': sorted_times[0],
+                    'max_ms': sorted_times[-1]
                 }
             time_series[hour] = hour_stats
         
@@ -378,8 +554,22 @@ class IPFSLogAnalyzer:
     
     def generate_report(self) -> str:
         """生成综合分析报告"""
-        if not self.entries:
-            return "没有找到有效的日志数据"
+        out = io.StringIO()
+        self.write_report(out)
+        return out.getvalue()
+    
+    def write_report(self, out: TextIO):
+        """把报告逐行写入文本流，不先拼接成一个完整字符串"""
+        lines = iter(self._report_lines())
+        out.write(next(lines))
+        for line in lines:
+            out.write("\n")
+            out.write(line)
+    
+    def _report_lines(self) -> List[str]:
+        """生成综合分析报告的各行"""
+        if not len(self):
+            return ["没有找到有效的日志数据"]
         
         self.calculate_stats()
         
@@ -391,8 +581,11 @@ class IPFSLogAnalyzer:
         
         # 基本统计
         report.append(f"📊 基本统计信息")
-        report.append(f"   总请求数: {len(self.entries)}")
-        report.append(f"   分析时间范围: {min(self.entries, key=lambda x: x.datetime).timestamp} 到 {max(self.entries, key=lambda x: x.datetime).timestamp}")
+        timestamp_ms = self.timestamp_ms
+        first_row = min(range(len(timestamp_ms)), key=timestamp_ms.__getitem__)
+        last_row = max(range(len(timestamp_ms)), key=timestamp_ms.__getitem__)
+        report.append(f"   总请求数: {len(self)}")
+        report.append(f"   分析时间范围: {self.timestamps[first_row]} 到 {self.timestamps[last_row]}")
         report.append(f"   涉及网关数: {len(self.gateway_stats)}")
         report.append("")
         
@@ -402,23 +595,14 @@ class IPFSLogAnalyzer:
         summary = self.get_gateway_summary()
         
         for gateway, stats in sorted(summary.items(), key=lambda x: x[1]['avg_elapsed_ms']):
-            report.append(f"网关: {gateway}")
-            report.append(f"  请求数: {stats['total_requests']}")
-            report.append(f"  平均耗时: {stats['avg_elapsed_ms']:.1f} ms")
-            report.append(f"  中位耗时: {stats['median_elapsed_ms']:.1f} ms")
-            report.append(f"  耗时范围: {stats['min_elapsed_ms']} - {stats['max_elapsed_ms']} ms")
-            report.append(f"  标准差: {stats['std_elapsed_ms']:.1f} ms")
-            report.append(f"  平均速度: {stats['avg_speed_kbps']:.1f} KB/s")
-            report.append(f"  总数据量: {stats['total_data_mb']:.2f} MB")
+            report.append(GATEWAY_SUMMARY_TEMPLATE.format_map(dict(stats, gateway=gateway)))
             
             # 添加耗时分布统计
-            report.append(f"  耗时分布:")
-            latency_dist = stats['latency_distribution']
-            for bucket_name, bucket_stats in latency_dist.items():
-                count = bucket_stats['count']
-                percentage = bucket_stats['percentage']
-                if count > 0:
-                    report.append(f"    {bucket_name}: {count}次 ({percentage:.1f}%)")
+            report.extend(
+                LATENCY_BUCKET_TEMPLATE.format_map(dict(bucket_stats, bucket_name=bucket_name))
+                for bucket_name, bucket_stats in stats['latency_distribution'].items()
+                if bucket_stats['count'] > 0
+            )
             report.append("")
         
         # 整体耗时分布对比
@@ -429,19 +613,16 @@ class IPFSLogAnalyzer:
         # Win Rate分析
         report.append("🏆 网关Win Rate分析")
         report.append("-" * 60)
-        win_rates = self.calculate_win_rates()
+        win_rates, optimal_scenario = self._analyze_files()
         
-        for gateway, wr_stats in sorted(win_rates.items(), key=lambda x: x[1]['win_rate'], reverse=True):
-            report.append(f"网关: {gateway}")
-            report.append(f"  获胜次数: {wr_stats['wins']} / {wr_stats['participations']}")
-            report.append(f"  Win Rate: {wr_stats['win_percentage']:.1f}%")
-            report.append("")
+        report.extend(
+            WIN_RATE_TEMPLATE.format_map(dict(wr_stats, gateway=gateway))
+            for gateway, wr_stats in sorted(win_rates.items(), key=lambda x: x[1]['win_rate'], reverse=True)
+        )
         
         # 最优网关场景分析
         report.append("⚡ 最优网关选择场景分析")
         report.append("-" * 60)
-        optimal_scenario = self.simulate_best_gateway_scenario()
-        
         if optimal_scenario:
             report.append(f"分析文件数: {optimal_scenario['files_analyzed']}")
             report.append(f"当前总耗时: {optimal_scenario['total_actual_time_ms']} ms")
@@ -466,8 +647,10 @@ class IPFSLogAnalyzer:
             for hour in sorted(time_series.keys())[-10:]:  # 显示最近10小时
                 report.append(f"时间: {hour}")
                 hour_data = time_series[hour]
-                for gateway, stats in hour_data.items():
-                    report.append(f"  {gateway}: {stats['count']}次, 平均{stats['avg_ms']:.1f}ms")
+                report.extend(
+                    HOURLY_ROW_TEMPLATE.format_map(dict(stats, gateway=gateway))
+                    for gateway, stats in hour_data.items()
+                )
                 report.append("")
         
         # 推荐建议
@@ -491,13 +674,14 @@ class IPFSLogAnalyzer:
         report.append("")
         report.append("=" * 80)
         
-        return "\n".join(report)
+        return report
 
 
 def main():
     parser = argparse.ArgumentParser(description='IPFS网关性能日志分析器')
     parser.add_argument('logfile', nargs='?', help='日志文件路径 (如果不提供则从stdin读取)')
     parser.add_argument('--output', '-o', help='输出报告到文件')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='并行解析的进程数，仅对数 GB 级日志有收益 (默认: 1)')
     
     args = parser.parse_args()
     
@@ -505,18 +689,17 @@ def main():
     
     try:
         if args.logfile:
-            analyzer.load_log_file(args.logfile)
+            analyzer.load_log_file(args.logfile, args.jobs)
         else:
             analyzer.load_log_from_stdin()
         
-        report = analyzer.generate_report()
-        
         if args.output:
             with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(report)
+                analyzer.write_report(f)
             print(f"报告已保存到: {args.output}")
         else:
-            print(report)
+            analyzer.write_report(sys.stdout)
+            print()
             
     except KeyboardInterrupt:
         print("\n分析被用户中断")
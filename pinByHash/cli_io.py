@@ -0,0 +1,63 @@
+import sys
+import json
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+
+def encode_line(out: dict) -> bytes:
+    # Compact UTF-8 JSON plus newline; the stdlib fallback produces the same bytes
+    if orjson is not None:
+        return orjson.dumps(out, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(out, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def open_stdout() -> BinaryIO:
+    sys.stdout.flush()
+    # closefd=False: closing this writer flushes it but leaves fd 1 open
+    return open(sys.stdout.fileno(), "wb", buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+
+
+def submit_in_order(
+    pool: ThreadPoolExecutor,
+    fn: Callable,
+    calls: Iterable[tuple],
+    max_pending: int,
+    on_wait: Callable[[], None],
+) -> Iterator[Future]:
+    # Submitting happens on a feeder thread, so a slow stdin never holds back finished
+    # results; the bounded queue keeps at most max_pending calls submitted but not consumed.
+    # on_wait runs whenever the next future is not ready yet (input idle or call in flight)
+    futures: "queue.Queue[Optional[Future]]" = queue.Queue(maxsize=max_pending)
+    errors: list[BaseException] = []
+
+    def feed() -> None:
+        try:
+            for args in calls:
+                futures.put(pool.submit(fn, *args))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            futures.put(None)
+
+    threading.Thread(target=feed, daemon=True).start()
+    while True:
+        if futures.empty():
+            on_wait()
+        fut = futures.get()
+        if fut is None:
+            break
+        if not fut.done():
+            on_wait()
+        yield fut
+    if errors:
+        raise errors[0]
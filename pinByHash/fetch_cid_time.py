@@ -2,14 +2,27 @@ import sys
 import os
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Iterable, Tuple, Optional
-from urllib import request, error
+
+from cli_io import encode_line, open_stdout, submit_in_order
+from keepalive import open_url
 
 
 DEFAULT_GATEWAYS = [
     "https://ipfs.io/ipfs/{cid}",
     "https://ok-test.mypinata.cloud/files/{cid}"
 ]
+DISCARD_BUFFER_SIZE = 1 << 20
+# Probes in flight when FETCH_CONCURRENCY is unset; subscriber.py uses the same default
+DEFAULT_FETCH_CONCURRENCY = 32
+FETCH_HEADERS = {
+    "Accept": "image/*,application/octet-stream;q=0.9,*/*;q=0.8",
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache",
+    "User-Agent": "cid-fetch-timer/1.0",
+}
 
 
 def iter_cids(argv: list[str]) -> Iterable[str]:
@@ -38,60 +51,75 @@ def iter_cids(argv: list[str]) -> Iterable[str]:
         yield text
 
 
-def build_urls(cid: str) -> list[str]:
-    env_gateways = os.getenv("IPFS_GATEWAYS")
+@lru_cache(maxsize=8)
+def gateway_templates(env_gateways: Optional[str]) -> Tuple[str, ...]:
+    # Parsed once per distinct IPFS_GATEWAYS value instead of once per CID
     if env_gateways:
-        return [g.strip().format(cid=cid) for g in env_gateways.split(",") if g.strip()]
-    return [tpl.format(cid=cid) for tpl in DEFAULT_GATEWAYS]
+        return tuple(g.strip() for g in env_gateways.split(",") if g.strip())
+    return tuple(DEFAULT_GATEWAYS)
+
+
+def build_urls(cid: str) -> list[str]:
+    return [tpl.format(cid=cid) for tpl in gateway_templates(os.getenv("IPFS_GATEWAYS"))]
 
 
 def download_discard(url: str, timeout_s: float) -> Tuple[int, int, Optional[str]]:
-    req = request.Request(url, method="GET")
-    req.add_header("Accept", "image/*,application/octet-stream;q=0.9,*/*;q=0.8")
-    req.add_header("Cache-Control", "no-cache")
-    req.add_header("Pragma", "no-cache")
-    req.add_header("User-Agent", "cid-fetch-timer/1.0")
     try:
-        with request.urlopen(req, timeout=timeout_s) as resp:
-            status = resp.getcode()
-            total_bytes = 0
-            chunk = resp.read(64 * 1024)
-            while chunk:
-                total_bytes += len(chunk)
-                chunk = resp.read(64 * 1024)
-            return status, total_bytes, None
-    except error.HTTPError as e:
-        try:
-            body = e.read().decode("utf-8", errors="replace")
-        except Exception:
-            body = ""
-        return e.code, 0, body[:300]
+        # Keep-alive per gateway host: only the first probe to each one pays the TCP/TLS handshake
+        resp = open_url("GET", url, FETCH_HEADERS, timeout=timeout_s)
+        status = resp.status
+        if status >= 400:
+            try:
+                body = resp.read().decode("utf-8", errors="replace")
+            except Exception:
+                body = ""
+            return status, 0, body[:300]
+        total_bytes = 0
+        # One reusable 1 MiB buffer: readinto fills it in place, no new bytes object per chunk
+        view = memoryview(bytearray(DISCARD_BUFFER_SIZE))
+        n = resp.readinto(view)
+        while n:
+            total_bytes += n
+            n = resp.readinto(view)
+        return status, total_bytes, None
     except Exception as e:
         return 0, 0, str(e)
 
 
+def fetch_one(cid: str, url: str, timeout_s: float) -> dict:
+    start = time.perf_counter()
+    status, size_bytes, err = download_discard(url, timeout_s)
+    elapsed_ms = int((time.perf_counter() - start) * 1000)
+    ok = 200 <= status < 300
+    out = {
+        "action": "gateway_fetch",
+        "cid": cid,
+        "url": url,
+        "status": status,
+        "elapsed_ms": elapsed_ms,
+        "size_bytes": size_bytes,
+        "ok": ok,
+    }
+    if err:
+        out["error"] = err
+    return out
+
+
 def main() -> int:
     argv = sys.argv
     timeout_s = float(os.getenv("GATEWAY_TIMEOUT_SECONDS", "20"))
-    for cid in iter_cids(argv):
-        urls = build_urls(cid)
-        for url in urls:
-            start = time.perf_counter()
-            status, size_bytes, err = download_discard(url, timeout_s)
-            elapsed_ms = int((time.perf_counter() - start) * 1000)
-            ok = 200 <= status < 300
-            out = {
-                "action": "gateway_fetch",
-                "cid": cid,
-                "url": url,
-                "status": status,
-                "elapsed_ms": elapsed_ms,
-                "size_bytes": size_bytes,
-                "ok": ok,
-            }
-            if err:
-                out["error"] = err
-            print(json.dumps(out, ensure_ascii=False))
+    concurrency = max(int(os.getenv("FETCH_CONCURRENCY", str(DEFAULT_FETCH_CONCURRENCY))), 1)
+    # Every (cid, gateway) probe is independent network I/O, so run them side by side;
+    # each probe times itself. CIDs are read lazily on a feeder thread with at most 2x
+    # concurrency probes pending, and lines come out in input order as soon as each one is
+    # done: per CID, per gateway
+    # 64 KiB buffered binary stdout: lines are written in blocks and flushed only before
+    # waiting on input or on a result, so pipes see each line without a write per line
+    max_pending = concurrency * 2
+    with open_stdout() as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        calls = ((cid, url, timeout_s) for cid in iter_cids(argv) for url in build_urls(cid))
+        for fut in submit_in_order(pool, fetch_one, calls, max_pending, out.flush):
+            out.write(encode_line(fut.result()))
     return 0
 
 
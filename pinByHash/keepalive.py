@@ -0,0 +1,80 @@
+import http.client
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+
+MAX_REDIRECTS = 10
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# http.client connections are not thread-safe, so each thread keeps its own per host
+_local = threading.local()
+
+
+def _connections() -> Dict[Tuple[str, str], http.client.HTTPConnection]:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+        _local.responses = {}
+    return conns
+
+
+def _connection(scheme: str, netloc: str, timeout: float) -> http.client.HTTPConnection:
+    conns = _connections()
+    key = (scheme, netloc)
+    conn = conns.get(key)
+    if conn is None:
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        conn = conns[key] = cls(netloc, timeout=timeout)
+    else:
+        # A previous response that was not read to the end leaves unread bytes on the socket
+        last = _local.responses.get(key)
+        if last is not None and not last.isclosed():
+            conn.close()
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    return conn
+
+
+def _send(method: str, url: str, headers: Dict[str, str], body: Optional[bytes], timeout: float) -> http.client.HTTPResponse:
+    parts = urlsplit(url)
+    target = parts.path or "/"
+    if parts.query:
+        target += "?" + parts.query
+    key = (parts.scheme, parts.netloc)
+    conn = _connection(parts.scheme, parts.netloc, timeout)
+    try:
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            resp = conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # The server may have dropped the idle connection; retry once on a fresh one
+            conn.close()
+            conn.request(method, target, body=body, headers=headers)
+            resp = conn.getresponse()
+    except Exception:
+        conn.close()
+        raise
+    _local.responses[key] = resp
+    return resp
+
+
+def open_url(method: str, url: str, headers: Optional[Dict[str, str]] = None, body: Optional[bytes] = None, timeout: float = 30.0) -> http.client.HTTPResponse:
+    """Send a request over this thread's keep-alive connection to the URL's host.
+
+    Redirects are followed like urllib does; error statuses are returned, not raised.
+    The response must be read to the end for its connection to be reused.
+    """
+    headers = dict(headers or {})
+    for _ in range(MAX_REDIRECTS):
+        resp = _send(method, url, headers, body, timeout)
+        location = resp.getheader("Location")
+        if resp.status not in REDIRECT_STATUSES or not location:
+            return resp
+        resp.read()
+        url = urljoin(url, location)
+        if resp.status in (301, 302, 303) and method not in ("GET", "HEAD"):
+            method, body = "GET", None
+            headers.pop("Content-Type", None)
+    return _send(method, url, headers, body, timeout)
@@ -2,11 +2,16 @@ import sys
 import os
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable, Optional, Tuple
-from urllib import request, error
+
+from cli_io import encode_line, open_stdout, submit_in_order
+from keepalive import open_url
 
 
 PINATA_ENDPOINT = "https://api.pinata.cloud/v3/files/public/pin_by_cid"
+# Pins in flight when PIN_CONCURRENCY is unset; subscriber.py uses the same default
+DEFAULT_PIN_CONCURRENCY = 16
 
 
 def iter_cids_from_args_or_stdin(argv: list[str]) -> Iterable[str]:
@@ -39,38 +44,53 @@ def iter_cids_from_args_or_stdin(argv: list[str]) -> Iterable[str]:
         yield text
 
 
-def build_request(jwt: str, cid: str) -> request.Request:
-    data = json.dumps({"cid": cid}).encode("utf-8")
-    req = request.Request(PINATA_ENDPOINT, data=data, method="POST")
-    req.add_header("Authorization", f"Bearer {jwt}")
-    req.add_header("Content-Type", "application/json")
-    req.add_header("Accept", "application/json")
-    return req
+def build_headers(jwt: str) -> dict:
+    return {
+        "Authorization": f"Bearer {jwt}",
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
 
 
 def pin_once(jwt: str, cid: str, timeout_s: float) -> Tuple[int, Optional[dict]]:
-    req = build_request(jwt, cid)
+    data = json.dumps({"cid": cid}).encode("utf-8")
     try:
-        with request.urlopen(req, timeout=timeout_s) as resp:
-            status = resp.getcode()
-            body_bytes = resp.read()
-            try:
-                body = json.loads(body_bytes.decode("utf-8", errors="replace")) if body_bytes else None
-            except Exception:
-                body = None
-            return status, body
-    except error.HTTPError as e:
+        # Reuses this thread's keep-alive connection to the Pinata API
+        resp = open_url("POST", PINATA_ENDPOINT, build_headers(jwt), data, timeout=timeout_s)
+        status = resp.status
+        body_bytes = resp.read()
+        if status >= 400:
+            body = body_bytes.decode("utf-8", errors="replace")
+            print(f"pinata_http_error cid={cid} status={status} body={body[:500]}", file=sys.stderr)
+            return status, None
         try:
-            body = e.read().decode("utf-8", errors="replace")
+            body = json.loads(body_bytes.decode("utf-8", errors="replace")) if body_bytes else None
         except Exception:
-            body = ""
-        print(f"pinata_http_error cid={cid} status={e.code} body={body[:500]}", file=sys.stderr)
-        return e.code, None
+            body = None
+        return status, body
     except Exception as e:
         print(f"pinata_error cid={cid} error={e}", file=sys.stderr)
         return 0, None
 
 
+def pin_timed(jwt: str, cid: str, timeout_s: float) -> dict:
+    start = time.perf_counter()
+    status, body = pin_once(jwt, cid, timeout_s)
+    elapsed_ms = int((time.perf_counter() - start) * 1000)
+    ok = 200 <= status < 300
+    # Print a compact, parseable line
+    out = {
+        "action": "pinata_pin_by_cid",
+        "cid": cid,
+        "status": status,
+        "elapsed_ms": elapsed_ms,
+        "ok": ok,
+    }
+    if body is not None:
+        out["response"] = body
+    return out
+
+
 def main() -> int:
     jwt = os.getenv("PINATA_JWT") or os.getenv("PINATA_BEARER")
     # Allow passing JWT as first arg flag
@@ -85,24 +105,20 @@ def main() -> int:
 
     timeout_s = float(os.getenv("PINATA_TIMEOUT_SECONDS", "15"))
 
+    concurrency = max(int(os.getenv("PIN_CONCURRENCY", str(DEFAULT_PIN_CONCURRENCY))), 1)
     had_error = False
-    for cid in iter_cids_from_args_or_stdin(argv):
-        start = time.perf_counter()
-        status, body = pin_once(jwt, cid, timeout_s)
-        elapsed_ms = int((time.perf_counter() - start) * 1000)
-        ok = 200 <= status < 300
-        had_error |= not ok
-        # Print a compact, parseable line
-        out = {
-            "action": "pinata_pin_by_cid",
-            "cid": cid,
-            "status": status,
-            "elapsed_ms": elapsed_ms,
-            "ok": ok,
-        }
-        if body is not None:
-            out["response"] = body
-        print(json.dumps(out, ensure_ascii=False))
+    # Pins are independent round-trips, so overlap them. CIDs are read lazily on a feeder
+    # thread with at most 2x concurrency pins pending, and lines are printed in input order
+    # as soon as each one is done
+    # 64 KiB buffered binary stdout: lines are written in blocks and flushed only before
+    # waiting on input or on a result, so pipes see each line without a write per line
+    max_pending = concurrency * 2
+    with open_stdout() as stdout, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        calls = ((jwt, cid, timeout_s) for cid in iter_cids_from_args_or_stdin(argv))
+        for fut in submit_in_order(pool, pin_timed, calls, max_pending, stdout.flush):
+            out = fut.result()
+            had_error |= not out["ok"]
+            stdout.write(encode_line(out))
 
     return 1 if had_error else 0
 
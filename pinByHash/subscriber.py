@@ -1,70 +1,202 @@
 import asyncio
 import json
+import sys
 import time
 import os
 import re
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, TextIO, Tuple
 
 import websockets
-from pin_to_pinata import pin_once
-from fetch_cid_time import download_discard, build_urls
+from pin_to_pinata import DEFAULT_PIN_CONCURRENCY, pin_once
+from fetch_cid_time import DEFAULT_FETCH_CONCURRENCY, download_discard, build_urls
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 
 NATS_WS_URL = "wss://prod-advanced.nats.realtime.pump.fun/"
 RAW_LOG_PATH = "raw.log"
 PARSED_LOG_PATH = "pump.log"
+FRAME_COMPACT_BYTES = 64 * 1024
 
 
 class NatsWsProtocolError(Exception):
     pass
 
 
-def now_ts_ms() -> str:
-    # Returns local time with millisecond precision
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+# Inbound payloads go through orjson when available; CONNECT still uses stdlib json
+_loads = orjson.loads if orjson is not None else json.loads
 
 
-async def write_line(path: str, line: str) -> None:
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(line)
-        if not line.endswith("\n"):
-            f.write("\n")
+def _dumps(obj: Dict[str, Any]) -> str:
+    # Compact log-line JSON with non-ASCII kept as-is, same bytes from either encoder
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits in a response body
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
 
+_ts_sec = -1
+_ts_prefix = ""
 
-async def handle_msg(subject: str, payload: str) -> None:
+
+def now_ts_ms() -> str:
+    # Returns local time with millisecond precision; the "%Y-%m-%d %H:%M:%S" part is
+    # formatted once per second and reused, only the milliseconds are appended per call
+    global _ts_sec, _ts_prefix
+    now = time.time()
+    sec = int(now)
+    if sec != _ts_sec:
+        _ts_sec = sec
+        _ts_prefix = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+    return f"{_ts_prefix}.{int((now - sec) * 1000):03d}"
+
+
+# One queue and writer task per log file, registered until close_logs() stops the writer;
+# None on a queue is the stop sentinel
+_log_queues: Dict[str, "asyncio.Queue[Optional[str]]"] = {}
+_log_writers: Dict[str, "asyncio.Task[None]"] = {}
+LOG_BATCH_LINES = 64
+LOG_BATCH_BYTES = 64 * 1024
+# Disk writes get their own thread, created by main(), so they never wait behind pin/fetch calls
+_log_executor: Optional[ThreadPoolExecutor] = None
+# Upper bounds on gateway fetches and on pins in flight across all CIDs, created by main(),
+# so a burst of mints queues up here instead of opening a socket per (CID, gateway) at once
+_fetch_slots: Optional[asyncio.Semaphore] = None
+_pin_slots: Optional[asyncio.Semaphore] = None
+# Pin and gateway requests run on a fixed pool created by main(): each worker keeps its
+# keep-alive connections (see keepalive.py) across CIDs instead of sharing the default pool
+_http_executor: Optional[ThreadPoolExecutor] = None
+# A CID seen again within this window (e.g. in both the create and the image-update
+# stream) is not pinned or fetched a second time; main() sets it from CID_DEDUP_SECONDS
+DEFAULT_CID_DEDUP_SECONDS = 60.0
+_cid_dedup_seconds = DEFAULT_CID_DEDUP_SECONDS
+# CID -> monotonic time it was last processed, oldest first
+_recent_cids: Dict[str, float] = {}
+
+
+def _seen_recently(cid: str) -> bool:
+    now = time.monotonic()
+    # Insertion order is time order, so expired entries are always at the front
+    while _recent_cids:
+        oldest = next(iter(_recent_cids))
+        if now - _recent_cids[oldest] < _cid_dedup_seconds:
+            break
+        del _recent_cids[oldest]
+    if cid in _recent_cids:
+        return True
+    _recent_cids[cid] = now
+    return False
+
+
+def write_line(path: str, line: str) -> None:
+    # Enqueue only: no file I/O on the caller's side of the event loop
+    queue = _log_queues.get(path)
+    if queue is None:
+        queue = _log_queues[path] = asyncio.Queue()
+        _log_writers[path] = asyncio.create_task(_log_writer(path, queue))
+    queue.put_nowait(line if line.endswith("\n") else line + "\n")
+
+
+def _append(f: TextIO, data: str) -> None:
+    f.write(data)
+    f.flush()
+
+
+async def _log_writer(path: str, queue: "asyncio.Queue[Optional[str]]") -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            while True:
+                # Coalesce whatever is queued (up to 64 lines / 64 KiB) into one write
+                batch: List[str] = []
+                size = 0
+                closing = False
+                line = await queue.get()
+                while True:
+                    if line is None:
+                        closing = True
+                        break
+                    batch.append(line)
+                    size += len(line)
+                    if queue.empty() or len(batch) >= LOG_BATCH_LINES or size >= LOG_BATCH_BYTES:
+                        break
+                    line = queue.get_nowait()
+                if batch:
+                    # The disk write runs off the event loop so it keeps reading the socket
+                    await loop.run_in_executor(_log_executor, _append, f, "".join(batch))
+                if closing:
+                    if queue.empty():
+                        return
+                    # Lines arrived during the last write: stop after them instead
+                    queue.put_nowait(None)
+    except Exception as e:
+        # e.g. disk full: report it and drop this queue; the next line starts a new writer
+        print(f"log_write_error path={path} dropped_lines={queue.qsize()} error={e}", file=sys.stderr)
+    finally:
+        # Unregister once the file is closed, whether stopped or failed, so write_line
+        # never feeds a queue nobody reads
+        del _log_queues[path]
+        del _log_writers[path]
+
+
+async def close_logs() -> None:
+    # Stop every writer once it has written all lines queued so far; a line logged
+    # meanwhile starts a new writer, which the loop waits for as well
+    while _log_writers:
+        path, task = next(iter(_log_writers.items()))
+        _log_queues[path].put_nowait(None)
+        await task
+
+
+async def handle_msg(subject: str, payload: bytes) -> None:
     ts = now_ts_ms()
-    await write_line(RAW_LOG_PATH, f"[{ts}] MSG {subject} {len(payload)}")
-    await write_line(RAW_LOG_PATH, payload)
+    text = payload.decode("utf-8", errors="replace")
+    write_line(RAW_LOG_PATH, f"[{ts}] MSG {subject} {len(payload)}")
+    write_line(RAW_LOG_PATH, text)
     try:
-        text = payload
-        if text.startswith('"') and text.endswith('"'):
-            text = json.loads(text)
-        obj = json.loads(text)
+        obj = _loads(payload)
+        if isinstance(obj, str):
+            # String-wrapped JSON: the first parse already unescaped it, decode the inner document
+            obj = _loads(obj)
         if isinstance(obj, dict):
             mint = obj.get("mint")
             image = obj.get("image")
-            await write_line(
+            write_line(
                 PARSED_LOG_PATH,
-                f"[{ts}] " + json.dumps(
+                f"[{ts}] " + _dumps(
                     {"ts": ts, "subject": subject, "mint": mint, "image": image},
-                    ensure_ascii=False,
                 ),
             )
             # Try to extract CID(s) from the message and process them
             for cid in extract_cids(obj):
+                if _seen_recently(cid):
+                    write_line(
+                        PARSED_LOG_PATH,
+                        f"[{ts}] " + _dumps({"ts": ts, "event": "cid_recently_seen", "cid": cid, "subject": subject}),
+                    )
+                    continue
                 asyncio.create_task(process_cid(cid, subject))
         else:
-            await write_line(
+            write_line(
                 PARSED_LOG_PATH,
-                f"[{ts}] " + json.dumps({"ts": ts, "subject": subject, "non_object": True}, ensure_ascii=False),
+                f"[{ts}] " + _dumps({"ts": ts, "subject": subject, "non_object": True}),
             )
     except Exception as exc:
-        await write_line(
+        write_line(
             PARSED_LOG_PATH,
-            f"[{ts}] " + json.dumps(
-                {"ts": ts, "subject": subject, "error": str(exc), "payload_preview": payload[:200]},
-                ensure_ascii=False,
+            f"[{ts}] " + _dumps(
+                {"ts": ts, "subject": subject, "error": str(exc), "payload_preview": text[:200]},
             ),
         )
 
@@ -103,12 +235,49 @@ def build_connect_options() -> Dict[str, Any]:
     return opts
 
 
-_CID_PATTERNS: List[re.Pattern[str]] = [
-    re.compile(r"ipfs://(?P<cid>[A-Za-z0-9]+)", re.IGNORECASE),
-    re.compile(r"/ipfs/(?P<cid>[A-Za-z0-9]+)", re.IGNORECASE),
-    re.compile(r"^(?P<cid>Qm[1-9A-HJ-NP-Za-km-z]{44})$"),  # CIDv0 approx
-    re.compile(r"^(?P<cid>bafy[\w]{20,})$", re.IGNORECASE),  # CIDv1 approx
-]
+def build_connect_frame() -> str:
+    # CONNECT, the subscriptions and the first PING as one websocket frame; built per
+    # connection so auth changes in the environment apply on the next reconnect
+    return (
+        "CONNECT " + json.dumps(build_connect_options()) + "\r\n"
+        # SUB both subjects with SIDs 4 and 2
+        "SUB advancedNewCoinCreated 4\r\n"
+        "SUB coinImageUpdated.> 2\r\n"
+        "SUB _WARMUP_ADVANCED_1758175505128 5\r\n"
+        "PING\r\n"
+    )
+
+
+# One pass over the image string: an ipfs:// or /ipfs/ URL anywhere, or the whole string
+# being a bare CIDv0 (case-sensitive) or CIDv1 (approx)
+_CID_RE = re.compile(
+    r"(?i:ipfs://|/ipfs/)(?P<url>[A-Za-z0-9]+)"
+    r"|^(?P<v0>Qm[1-9A-HJ-NP-Za-km-z]{44})$"
+    r"|^(?i:(?P<v1>bafy[\w]{20,}))$"
+)
+
+
+def cid_from_image(image: str) -> Optional[str]:
+    # Fast path for the usual 'ipfs://<cid>' and '<gateway>/ipfs/<cid>' shapes, with no regex:
+    # when the marker found by str.find is the leftmost one (nothing case- or scheme-variant
+    # before it) and the segment after it is plain ASCII alphanumerics, that segment is
+    # exactly what _CID_RE would capture. Anything else falls through to the regex.
+    if image.startswith("ipfs://"):
+        start = 7
+    else:
+        path = image.find("/ipfs/")
+        head = image[:path + 1].lower()
+        if path == -1 or not head.isascii() or "ipfs://" in head or "/ipfs/" in head:
+            start = -1
+        else:
+            start = path + 6
+    if start != -1:
+        end = image.find("/", start)
+        cid = image[start:end] if end != -1 else image[start:]
+        if cid.isascii() and cid.isalnum():
+            return cid
+    m = _CID_RE.search(image)
+    return m.group(m.lastgroup) if m else None
 
 
 def extract_cids(obj: Dict[str, Any]) -> List[str]:
@@ -120,50 +289,86 @@ def extract_cids(obj: Dict[str, Any]) -> List[str]:
     # Image field may contain ipfs URL or CID
     image = obj.get("image")
     if isinstance(image, str) and image:
-        for pat in _CID_PATTERNS:
-            m = pat.search(image)
-            if m:
-                cids.append(m.group("cid"))
-                break
+        cid = cid_from_image(image)
+        if cid:
+            cids.append(cid)
         else:
             # Fallback: bare token-like
             token = image.strip()
             if token and (token.startswith("Qm") or token.lower().startswith("bafy")):
                 cids.append(token)
-    # Deduplicate preserving order
-    seen = set()
-    result: List[str] = []
-    for c in cids:
-        if c and c not in seen:
-            seen.add(c)
-            result.append(c)
-    return result
+    # Entries are never empty; one CID (the usual case) needs no dedup, otherwise
+    # dict.fromkeys drops repeats in one C-level pass, preserving order
+    if len(cids) < 2:
+        return cids
+    return list(dict.fromkeys(cids))
 
 
-async def process_cid(cid: str, subject: str) -> None:
+def _timed_download(url: str, timeout_s: float) -> Tuple[int, int, Optional[str], int]:
+    # Runs on the worker thread, so elapsed_ms is the request alone, not time spent queued
+    start = time.perf_counter()
+    try:
+        status, size_bytes, err = download_discard(url, timeout_s)
+    except Exception as e:
+        status, size_bytes, err = 0, 0, str(e)
+    return status, size_bytes, err, int((time.perf_counter() - start) * 1000)
+
+
+def _timed_pin(jwt: str, cid: str, timeout_s: float) -> Tuple[int, Optional[dict], int]:
+    start = time.perf_counter()
+    status, body = pin_once(jwt, cid, timeout_s)
+    return status, body, int((time.perf_counter() - start) * 1000)
+
+
+async def _fetch_and_log(cid: str, subject: str, url: str, timeout_s: float) -> None:
+    async with _fetch_slots:
+        status, size_bytes, err, elapsed_ms = await asyncio.get_running_loop().run_in_executor(
+            _http_executor, _timed_download, url, timeout_s
+        )
     ts = now_ts_ms()
+    write_line(
+        PARSED_LOG_PATH,
+        f"[{ts}] " + _dumps({
+            "ts": ts,
+            "event": "gateway_fetch",
+            "cid": cid,
+            "subject": subject,
+            "url": url,
+            "status": status,
+            "elapsed_ms": elapsed_ms,
+            "size_bytes": size_bytes,
+            "ok": 200 <= status < 300,
+            "error": err,
+        }),
+    )
+
+
+async def process_cid(cid: str, subject: str) -> None:
     # Run Pinata pin and first gateway fetch concurrently
     async def do_pin() -> None:
         jwt = os.getenv("PINATA_JWT") or os.getenv("PINATA_BEARER")
         if not jwt:
-            await write_line(
+            ts = now_ts_ms()
+            write_line(
                 PARSED_LOG_PATH,
-                f"[{now_ts_ms()}] " + json.dumps({
-                    "ts": now_ts_ms(),
+                f"[{ts}] " + _dumps({
+                    "ts": ts,
                     "event": "pinata_skip_no_jwt",
                     "cid": cid,
                     "subject": subject,
-                }, ensure_ascii=False),
+                }),
             )
             return
         timeout_s = float(os.getenv("PINATA_TIMEOUT_SECONDS", "15"))
-        start = time.perf_counter()
-        status, body = await asyncio.to_thread(pin_once, jwt, cid, timeout_s)
-        elapsed_ms = int((time.perf_counter() - start) * 1000)
-        await write_line(
+        async with _pin_slots:
+            status, body, elapsed_ms = await asyncio.get_running_loop().run_in_executor(
+                _http_executor, _timed_pin, jwt, cid, timeout_s
+            )
+        ts = now_ts_ms()
+        write_line(
             PARSED_LOG_PATH,
-            f"[{now_ts_ms()}] " + json.dumps({
-                "ts": now_ts_ms(),
+            f"[{ts}] " + _dumps({
+                "ts": ts,
                 "event": "pinata_pin_by_cid",
                 "cid": cid,
                 "subject": subject,
@@ -171,39 +376,32 @@ async def process_cid(cid: str, subject: str) -> None:
                 "elapsed_ms": elapsed_ms,
                 "ok": 200 <= status < 300,
                 "response": body,
-            }, ensure_ascii=False),
+            }),
         )
 
-    async def do_fetch() -> None:
+    # The pin and every configured gateway fetch run as their own tasks; each logs as it completes
+    tasks = [asyncio.create_task(do_pin())]
+    try:
         timeout_s = float(os.getenv("GATEWAY_TIMEOUT_SECONDS", "20"))
-        urls = build_urls(cid)
-        # Launch all configured gateways concurrently and log as each completes
-        async def fetch_and_log(url: str) -> None:
-            start = time.perf_counter()
-            try:
-                status, size_bytes, err = await asyncio.to_thread(download_discard, url, timeout_s)
-            except Exception as e:
-                status, size_bytes, err = 0, 0, str(e)
-            elapsed_ms = int((time.perf_counter() - start) * 1000)
-            await write_line(
-                PARSED_LOG_PATH,
-                f"[{now_ts_ms()}] " + json.dumps({
-                    "ts": now_ts_ms(),
-                    "event": "gateway_fetch",
-                    "cid": cid,
-                    "subject": subject,
-                    "url": url,
-                    "status": status,
-                    "elapsed_ms": elapsed_ms,
-                    "size_bytes": size_bytes,
-                    "ok": 200 <= status < 300,
-                    "error": err,
-                }, ensure_ascii=False),
-            )
-
-        await asyncio.gather(*(fetch_and_log(u) for u in urls))
-
-    await asyncio.gather(do_pin(), do_fetch())
+        tasks += [asyncio.create_task(_fetch_and_log(cid, subject, url, timeout_s)) for url in build_urls(cid)]
+    finally:
+        # Wait for every task that was started, even if one failed or building the list did
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def _recv_into(ws: Any, buf: bytearray, pos: int) -> int:
+    # Consumed bytes before the read cursor are dropped only once they pile up (or the
+    # buffer is fully read), so parsing a message never shifts the rest of the buffer
+    if pos >= FRAME_COMPACT_BYTES or pos == len(buf):
+        del buf[:pos]
+        pos = 0
+    # Text frames arrive as str, binary frames as bytes; both are appended as bytes
+    more = await ws.recv()
+    buf += more.encode("utf-8") if isinstance(more, str) else more
+    return pos
 
 
 async def nats_ws_subscribe(url: str) -> None:
@@ -236,69 +434,53 @@ async def nats_ws_subscribe(url: str) -> None:
                 ),
                 compression="deflate",
             ) as ws:
-                # Read until we get INFO
-                partial = ""
+                # Read until we get INFO; frames are buffered as bytes and only payloads are decoded
+                partial = bytearray()
+                pos = 0
                 info_received = False
                 while not info_received:
-                    more = await ws.recv()
-                    if isinstance(more, bytes):
-                        more = more.decode("utf-8", errors="replace")
-                    partial += more
-                    while "\r\n" in partial:
-                        line, partial = partial.split("\r\n", 1)
+                    pos = await _recv_into(ws, partial, pos)
+                    while True:
+                        nl = partial.find(b"\r\n", pos)
+                        if nl < 0:
+                            break
+                        line = bytes(partial[pos:nl])
+                        pos = nl + 2
                         if not line:
                             continue
-                        if line.startswith("INFO "):
+                        if line.startswith(b"INFO "):
                             info_received = True
                             try:
-                                info_obj = json.loads(line[5:].strip())
-                                await write_line(PARSED_LOG_PATH, json.dumps({"ts": now_ts_ms(), "event": "server_info", "info_keys": sorted(list(info_obj.keys()))}, ensure_ascii=False))
+                                info_obj = _loads(line[5:].strip())
+                                write_line(PARSED_LOG_PATH, _dumps({"ts": now_ts_ms(), "event": "server_info", "info_keys": sorted(list(info_obj.keys()))}))
                             except Exception:
                                 pass
                             break
-                        elif line.startswith("PING"):
+                        elif line.startswith(b"PING"):
                             await ws.send("PONG\r\n")
-                        elif line.startswith("-ERR"):
-                            raise NatsWsProtocolError(line)
-
-                # CONNECT with provided auth/options
-                connect_opts = build_connect_options()
-                await ws.send("CONNECT " + json.dumps(connect_opts) + "\r\n")
-
-                # SUB both subjects with SIDs 4 and 2
-                await ws.send("SUB advancedNewCoinCreated 4\r\n")
-                await ws.send("SUB coinImageUpdated.> 2\r\n")
-                await ws.send("SUB _WARMUP_ADVANCED_1758175505128 5\r\n")
-                
+                        elif line.startswith(b"-ERR"):
+                            raise NatsWsProtocolError(line.decode("utf-8", errors="replace"))
 
-                await ws.send("PING\r\n")
+                # CONNECT with provided auth/options, then subscribe and PING
+                await ws.send(build_connect_frame())
 
                 expected_payload: Optional[int] = None
                 expected_header_len: Optional[int] = None
                 current_subject: Optional[str] = None
 
                 while True:
-                    if "\r\n" not in partial and expected_payload is None:
-                        more = await ws.recv()
-                        if isinstance(more, bytes):
-                            more = more.decode("utf-8", errors="replace")
-                        partial += more
-                        continue
-
                     if expected_payload is not None:
-                        if len(partial) < expected_payload + 2:
-                            more = await ws.recv()
-                            if isinstance(more, bytes):
-                                more = more.decode("utf-8", errors="replace")
-                            partial += more
+                        end = pos + expected_payload
+                        if len(partial) < end + 2:
+                            pos = await _recv_into(ws, partial, pos)
                             continue
 
-                        payload_block = partial[:expected_payload]
+                        payload_block = bytes(partial[pos:end])
                         # Skip trailing CRLF after payload
-                        if partial[expected_payload:expected_payload + 2] == "\r\n":
-                            partial = partial[expected_payload + 2:]
+                        if partial[end:end + 2] == b"\r\n":
+                            pos = end + 2
                         else:
-                            partial = partial[expected_payload:]
+                            pos = end
 
                         if expected_header_len is not None:
                             # HMSG: first expected_header_len bytes are headers, remainder is body
@@ -314,54 +496,76 @@ async def nats_ws_subscribe(url: str) -> None:
                         current_subject = None
                         continue
 
-                    line, partial = partial.split("\r\n", 1)
+                    nl = partial.find(b"\r\n", pos)
+                    if nl < 0:
+                        pos = await _recv_into(ws, partial, pos)
+                        continue
+                    line = bytes(partial[pos:nl])
+                    pos = nl + 2
                     if not line:
                         continue
-                    if line.startswith("PING"):
+                    if line.startswith(b"PING"):
                         await ws.send("PONG\r\n")
                         continue
-                    if line.startswith("PONG"):
+                    if line.startswith(b"PONG"):
                         continue
-                    if line.startswith("INFO "):
+                    if line.startswith(b"INFO "):
                         continue
-                    if line.startswith("-ERR"):
-                        raise NatsWsProtocolError(line)
-                    if line.startswith("MSG "):
+                    if line.startswith(b"-ERR"):
+                        raise NatsWsProtocolError(line.decode("utf-8", errors="replace"))
+                    if line.startswith(b"MSG "):
                         # MSG <subject> <sid> <size> [reply-to]
                         parts = line.split()
                         if len(parts) < 4:
-                            raise NatsWsProtocolError(f"Bad MSG header: {line}")
-                        current_subject = parts[1]
+                            raise NatsWsProtocolError(f"Bad MSG header: {line.decode('utf-8', errors='replace')}")
+                        current_subject = parts[1].decode("utf-8", errors="replace")
                         try:
                             expected_payload = int(parts[3])
                         except ValueError:
-                            raise NatsWsProtocolError(f"Invalid length in MSG: {line}")
+                            raise NatsWsProtocolError(f"Invalid length in MSG: {line.decode('utf-8', errors='replace')}")
                         expected_header_len = None
                         continue
-                    if line.startswith("HMSG "):
+                    if line.startswith(b"HMSG "):
                         # HMSG <subject> <sid> <hdr_len> <total_len> [reply-to]
                         parts = line.split()
                         if len(parts) < 5:
-                            raise NatsWsProtocolError(f"Bad HMSG header: {line}")
-                        current_subject = parts[1]
+                            raise NatsWsProtocolError(f"Bad HMSG header: {line.decode('utf-8', errors='replace')}")
+                        current_subject = parts[1].decode("utf-8", errors="replace")
                         try:
                             expected_header_len = int(parts[3])
                             expected_payload = int(parts[4])
                         except ValueError:
-                            raise NatsWsProtocolError(f"Invalid lengths in HMSG: {line}")
+                            raise NatsWsProtocolError(f"Invalid lengths in HMSG: {line.decode('utf-8', errors='replace')}")
                         continue
                     # Unknown line: ignore
 
                 backoff_seconds = 1
         except Exception as exc:
-            await write_line(PARSED_LOG_PATH, json.dumps({"ts": now_ts_ms(), "event": "reconnect", "error": str(exc), "backoff_s": backoff_seconds}, ensure_ascii=False))
+            write_line(PARSED_LOG_PATH, _dumps({"ts": now_ts_ms(), "event": "reconnect", "error": str(exc), "backoff_s": backoff_seconds}))
             await asyncio.sleep(backoff_seconds)
             backoff_seconds = min(backoff_seconds * 2, 30)
 
 
 async def main() -> None:
-    await nats_ws_subscribe(NATS_WS_URL)
+    global _http_executor, _log_executor, _fetch_slots, _pin_slots, _cid_dedup_seconds
+    _cid_dedup_seconds = float(os.getenv("CID_DEDUP_SECONDS", str(DEFAULT_CID_DEDUP_SECONDS)))
+    fetch_concurrency = max(int(os.getenv("FETCH_CONCURRENCY", str(DEFAULT_FETCH_CONCURRENCY))), 1)
+    pin_concurrency = max(int(os.getenv("PIN_CONCURRENCY", str(DEFAULT_PIN_CONCURRENCY))), 1)
+    _fetch_slots = asyncio.Semaphore(fetch_concurrency)
+    _pin_slots = asyncio.Semaphore(pin_concurrency)
+    # One worker per slot, so a request that holds a slot never waits for a thread
+    _http_executor = ThreadPoolExecutor(max_workers=fetch_concurrency + pin_concurrency, thread_name_prefix="http")
+    _log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-writer")
+    try:
+        await nats_ws_subscribe(NATS_WS_URL)
+    finally:
+        await close_logs()
+        _http_executor.shutdown(wait=False, cancel_futures=True)
+        _log_executor.shutdown()
 
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        # libuv-backed loop for the websocket and pin/fetch I/O; the code is loop-agnostic
+        uvloop.install()
     asyncio.run(main())
@@ -10,39 +10,99 @@ import statistics
 from collections import defaultdict, Counter
 from datetime import datetime
 import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+from stats_utils import int_stdev
+
+# 按 4MiB 块读取日志，每块只做一次 rfind 和一次 split
+READ_CHUNK_BYTES = 4 << 20
+# 小时字符串 "00".."23" 到 0..23 槽位的映射，其他写法查不到，按解析失败跳过
+HOUR_SLOTS = {f"{h:02d}": h for h in range(24)}
+# 字节级预过滤：只有包含 smart_ipfs_ 事件名前缀的行才进入 JSON 解析
+SMART_EVENT_MARKER = b'smart_ipfs_'
+
+# 耗时区间分布的边界与标签（左闭右开）
+TIME_RANGES = [
+    (0, 200, "< 200ms"),
+    (200, 500, "200-500ms"),
+    (500, 1000, "500ms-1s"),
+    (1000, 2000, "1-2s"),
+    (2000, 5000, "2-5s"),
+    (5000, float('inf'), "> 5s")
+]
 
 def parse_log_line(line):
-    """解析日志行，提取JSON数据"""
+    """解析日志行（bytes），提取JSON数据"""
     try:
         # 查找JSON部分 (在时间戳后的大括号)
-        json_start = line.find('{')
+        json_start = line.find(b'{')
         if json_start == -1:
             return None
         
-        json_str = line[json_start:]
-        return json.loads(json_str)
-    except (json.JSONDecodeError, ValueError):
+        return _json.loads(line[json_start:])
+    except ValueError:  # 包括 JSONDecodeError 与非法 UTF-8
         return None
 
+def iter_log_lines(f):
+    """从二进制文件按块读取，逐行产出 bytes（块尾的半行留到下一块拼接）"""
+    tail = b''
+    while True:
+        chunk = f.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        cut = chunk.rfind(b'\n')
+        if cut == -1:
+            tail += chunk
+            continue
+        lines = (tail + chunk[:cut]).split(b'\n')
+        tail = chunk[cut + 1:]
+        yield from lines
+    if tail:
+        yield tail
+
 def analyze_performance(log_file):
     """分析性能数据"""
     
-    # 数据收集
-    success_events = []
-    failed_events = []
-    local_success = []
-    fallback_success = []
+    # 数据收集：只保留报告用到的数值列，不保存整条事件 dict
+    success_times = array('q')         # 所有成功事件的 total_elapsed_ms
+    local_times = array('q')
+    fallback_times = array('q')
+    fallback_fetch_times = array('q')  # 仅非零的 fetch_elapsed_ms
+    sizes = array('q')                 # 仅非零的 bytes
+    speeds = array('d')                # 仅非零的 speed_kbps
+    failed_count = 0
+    # 总耗时的和与平方和随扫描累加（精确整数），均值和标准差不必再遍历样本
+    success_sum = 0
+    success_squares = 0
     
     # 网关性能统计
-    gateway_stats = defaultdict(list)
+    gateway_stats = defaultdict(lambda: array('q'))
     
     # 按小时统计
-    hourly_stats = defaultdict(lambda: {'success': 0, 'failed': 0, 'total_time': 0, 'times': []})
+    # 按小时统计：24 个固定槽位，每个指标一列（下标即小时）
+    hourly_stats = {
+        'success': array('q', [0]) * 24,
+        'failed': array('q', [0]) * 24,
+        'total_time': array('q', [0]) * 24,
+        'times': [array('q') for _ in range(24)],
+    }
+    hourly_success = hourly_stats['success']
+    hourly_failed = hourly_stats['failed']
+    hourly_total_time = hourly_stats['total_time']
+    hourly_times = hourly_stats['times']
     
     print("📊 正在分析日志文件...")
     
-    with open(log_file, 'r', encoding='utf-8') as f:
-        for line_num, line in enumerate(f, 1):
+    with open(log_file, 'rb') as f:
+        for line in iter_log_lines(f):
+            if SMART_EVENT_MARKER not in line:
+                continue
             data = parse_log_line(line)
             if not data:
                 continue
@@ -51,35 +111,47 @@ def analyze_performance(log_file):
             
             # 收集成功事件
             if event == 'smart_ipfs_fetch_success':
-                success_events.append(data)
+                total_elapsed = data.get('total_elapsed_ms', 0)
+                success_times.append(total_elapsed)
+                success_sum += total_elapsed
+                success_squares += total_elapsed * total_elapsed
                 
                 # 按策略分类
                 strategy = data.get('strategy', '')
                 if strategy == 'local_only':
-                    local_success.append(data)
+                    local_times.append(total_elapsed)
                 elif strategy == 'fallback_to_public':
-                    fallback_success.append(data)
+                    fallback_times.append(total_elapsed)
+                    fetch_elapsed = data.get('fetch_elapsed_ms')
+                    if fetch_elapsed:
+                        fallback_fetch_times.append(fetch_elapsed)
+                
+                size = data.get('bytes')
+                if size:
+                    sizes.append(size)
+                speed = data.get('speed_kbps')
+                if speed:
+                    speeds.append(speed)
                 
                 # 按小时统计
                 try:
                     ts = data.get('ts', '')
-                    hour = ts.split(' ')[1].split(':')[0] if ' ' in ts else '00'
-                    elapsed_ms = data.get('total_elapsed_ms', 0)
-                    hourly_stats[hour]['success'] += 1
-                    hourly_stats[hour]['total_time'] += elapsed_ms
-                    hourly_stats[hour]['times'].append(elapsed_ms)
+                    hour = hour_slot(ts)
+                    hourly_success[hour] += 1
+                    hourly_total_time[hour] += total_elapsed
+                    hourly_times[hour].append(total_elapsed)
                 except:
                     pass
             
             # 收集失败事件
             elif event == 'smart_ipfs_fetch_failed':
-                failed_events.append(data)
+                failed_count += 1
                 
                 # 按小时统计失败
                 try:
                     ts = data.get('ts', '')
-                    hour = ts.split(' ')[1].split(':')[0] if ' ' in ts else '00'
-                    hourly_stats[hour]['failed'] += 1
+                    hour = hour_slot(ts)
+                    hourly_failed[hour] += 1
                 except:
                     pass
             
@@ -91,20 +163,49 @@ def analyze_performance(log_file):
                     gateway_stats[gateway].append(elapsed)
     
     return {
-        'success_events': success_events,
-        'failed_events': failed_events,
-        'local_success': local_success,
-        'fallback_success': fallback_success,
+        'success_times': success_times,
+        'success_sum': success_sum,
+        'success_squares': success_squares,
+        'failed_count': failed_count,
+        'local_times': local_times,
+        'fallback_times': fallback_times,
+        'fallback_fetch_times': fallback_fetch_times,
+        'sizes': sizes,
+        'speeds': speeds,
         'gateway_stats': dict(gateway_stats),
-        'hourly_stats': dict(hourly_stats)
+        'hourly_stats': hourly_stats
     }
 
-def calculate_percentiles(data, percentiles=[50, 75, 90, 95, 99]):
-    """计算百分位数"""
+def hour_slot(ts):
+    """时间戳 "YYYY-MM-DD HH:MM:SS.fff" 的小时槽位（0-23）
+    
+    标准格式直接切片 ts[11:13]；其他写法按空格/冒号拆分，没有空格的记为 00。
+    小时不是两位数字时抛出 KeyError。
+    """
+    if ts[10:11] == ' ' and ts[13:14] == ':':
+        return HOUR_SLOTS[ts[11:13]]
+    return HOUR_SLOTS[ts.split(' ')[1].split(':')[0] if ' ' in ts else '00']
+
+def int_mean(data, total=None):
+    """整数样本均值：整除时返回 int，否则返回正确舍入的 float（与 statistics.mean 一致）
+    
+    已累加好的和可以通过 total 传入，省去一次求和。
+    """
+    if total is None:
+        total = sum(data)
+    n = len(data)
+    return total // n if total % n == 0 else total / n
+
+def count_in_range(sorted_data, min_val, max_val):
+    """已排序数据中落在 [min_val, max_val) 的个数，两次二分查找"""
+    return bisect_left(sorted_data, max_val) - bisect_left(sorted_data, min_val)
+
+def calculate_percentiles(data, percentiles=[50, 75, 90, 95, 99], presorted=False):
+    """计算百分位数（presorted=True 时直接使用已排序的 data，不再排序）"""
     if not data:
         return {p: 0 for p in percentiles}
     
-    sorted_data = sorted(data)
+    sorted_data = data if presorted else sorted(data)
     result = {}
     for p in percentiles:
         idx = int(len(sorted_data) * p / 100)
@@ -113,8 +214,8 @@ def calculate_percentiles(data, percentiles=[50, 75, 90, 95, 99]):
         result[p] = sorted_data[idx]
     return result
 
-def calculate_p95_average(data):
-    """计算P95平均耗时（去除极大值后的平均）"""
+def calculate_p95_average(data, presorted=False):
+    """计算P95平均耗时（去除极大值后的平均；presorted 同上）"""
     if not data:
         return 0
     
@@ -122,14 +223,14 @@ def calculate_p95_average(data):
         return data[0]
     
     # 计算P95分位数作为截断点
-    sorted_data = sorted(data)
+    sorted_data = data if presorted else sorted(data)
     p95_idx = int(len(sorted_data) * 95 / 100)
     if p95_idx >= len(sorted_data):
         p95_idx = len(sorted_data) - 1
     
     # 取P95以下的数据计算平均值
     p95_data = sorted_data[:p95_idx + 1]
-    return statistics.mean(p95_data) if p95_data else 0
+    return int_mean(p95_data) if p95_data else 0
 
 def format_time(ms):
     """格式化时间显示"""
@@ -152,14 +253,15 @@ def format_size(bytes_val):
 def print_report(stats):
     """生成详细的分析报告"""
     
-    success_events = stats['success_events']
-    failed_events = stats['failed_events']
-    local_success = stats['local_success']
-    fallback_success = stats['fallback_success']
+    all_times = stats['success_times']
+    failed_count = stats['failed_count']
+    local_times = stats['local_times']
+    fallback_times = stats['fallback_times']
     gateway_stats = stats['gateway_stats']
     hourly_stats = stats['hourly_stats']
     
-    total_attempts = len(success_events) + len(failed_events)
+    success_count = len(all_times)
+    total_attempts = success_count + failed_count
     
     print("\n" + "="*80)
     print("🚀 SMART IPFS FETCHER 性能分析报告")
@@ -172,29 +274,28 @@ def print_report(stats):
     # 1. 总体概况
     print("\n📈 总体概况")
     print("-" * 40)
-    success_rate = len(success_events) / total_attempts * 100
+    success_rate = success_count / total_attempts * 100
     print(f"总拉取次数: {total_attempts:,}")
-    print(f"成功次数: {len(success_events):,}")
-    print(f"失败次数: {len(failed_events):,}")
+    print(f"成功次数: {success_count:,}")
+    print(f"失败次数: {failed_count:,}")
     print(f"成功率: {success_rate:.1f}%")
     
-    if not success_events:
+    if not success_count:
         print("\n❌ 没有成功的拉取事件，无法进行详细分析")
         return
     
     # 2. 策略效果分析
     print(f"\n🎯 策略效果分析")
     print("-" * 40)
-    local_count = len(local_success)
-    fallback_count = len(fallback_success)
+    local_count = len(local_times)
+    fallback_count = len(fallback_times)
     
-    print(f"本地网关成功: {local_count:,} 次 ({local_count/len(success_events)*100:.1f}%)")
-    print(f"回退到公共网关: {fallback_count:,} 次 ({fallback_count/len(success_events)*100:.1f}%)")
+    print(f"本地网关成功: {local_count:,} 次 ({local_count/success_count*100:.1f}%)")
+    print(f"回退到公共网关: {fallback_count:,} 次 ({fallback_count/success_count*100:.1f}%)")
     
     # 本地网关成功的平均时间
-    if local_success:
-        local_times = [event.get('total_elapsed_ms', 0) for event in local_success]
-        local_avg = statistics.mean(local_times)
+    if local_times:
+        local_avg = int_mean(local_times)
         local_percentiles = calculate_percentiles(local_times)
         print(f"\n📊 本地网关成功统计:")
         print(f"  平均耗时: {format_time(local_avg)}")
@@ -202,10 +303,9 @@ def print_report(stats):
         print(f"  95分位数: {format_time(local_percentiles[95])}")
     
     # 回退策略的详细分析
-    if fallback_success:
-        fallback_times = [event.get('total_elapsed_ms', 0) for event in fallback_success]
-        fallback_fetch_times = [event.get('fetch_elapsed_ms', 0) for event in fallback_success if event.get('fetch_elapsed_ms')]
-        fallback_avg = statistics.mean(fallback_times)
+    if fallback_times:
+        fallback_fetch_times = stats['fallback_fetch_times']
+        fallback_avg = int_mean(fallback_times)
         fallback_percentiles = calculate_percentiles(fallback_times)
         
         print(f"\n📊 回退策略统计:")
@@ -214,24 +314,26 @@ def print_report(stats):
         print(f"  95分位数: {format_time(fallback_percentiles[95])}")
         
         if fallback_fetch_times:
-            fetch_avg = statistics.mean(fallback_fetch_times)
+            fetch_avg = int_mean(fallback_fetch_times)
             print(f"  平均下载耗时: {format_time(fetch_avg)}")
     
     # 3. 总耗时分布分析
     print(f"\n⏱️  总耗时分布分析")
     print("-" * 40)
     
-    all_times = [event.get('total_elapsed_ms', 0) for event in success_events]
-    avg_time = statistics.mean(all_times)
-    percentiles = calculate_percentiles(all_times)
-    p95_avg_time = calculate_p95_average(all_times)
+    # 排序一次，百分位、P95平均、最值和区间计数共用
+    sorted_times = sorted(all_times)
+    avg_time = int_mean(all_times, stats['success_sum'])
+    percentiles = calculate_percentiles(sorted_times, presorted=True)
+    p95_avg_time = calculate_p95_average(sorted_times, presorted=True)
     
     print(f"样本数量: {len(all_times):,}")
     print(f"平均耗时: {format_time(avg_time)}")
     print(f"P95平均耗时: {format_time(p95_avg_time)}")
-    print(f"最短耗时: {format_time(min(all_times))}")
-    print(f"最长耗时: {format_time(max(all_times))}")
-    print(f"标准差: {format_time(statistics.stdev(all_times) if len(all_times) > 1 else 0)}")
+    print(f"最短耗时: {format_time(sorted_times[0])}")
+    print(f"最长耗时: {format_time(sorted_times[-1])}")
+    stdev_time = int_stdev(len(all_times), stats['success_sum'], stats['success_squares']) if len(all_times) > 1 else 0
+    print(f"标准差: {format_time(stdev_time)}")
     
     print(f"\n百分位数分布:")
     for p in [50, 75, 90, 95, 99]:
@@ -239,17 +341,8 @@ def print_report(stats):
     
     # 耗时区间分布
     print(f"\n耗时区间分布:")
-    ranges = [
-        (0, 200, "< 200ms"),
-        (200, 500, "200-500ms"), 
-        (500, 1000, "500ms-1s"),
-        (1000, 2000, "1-2s"),
-        (2000, 5000, "2-5s"),
-        (5000, float('inf'), "> 5s")
-    ]
-    
-    for min_val, max_val, label in ranges:
-        count = sum(1 for t in all_times if min_val <= t < max_val)
+    for min_val, max_val, label in TIME_RANGES:
+        count = count_in_range(sorted_times, min_val, max_val)
         percentage = count / len(all_times) * 100
         bar = "█" * int(percentage / 2)  # 简单的条形图
         print(f"  {label:>10}: {count:4d} ({percentage:5.1f}%) {bar}")
@@ -262,7 +355,7 @@ def print_report(stats):
         gateway_performance = []
         for gateway, times in gateway_stats.items():
             if times:
-                avg_time = statistics.mean(times)
+                avg_time = int_mean(times)
                 p95_avg_time = calculate_p95_average(times)
                 gateway_performance.append((gateway, avg_time, p95_avg_time, len(times)))
         
@@ -285,58 +378,60 @@ def print_report(stats):
     print(f"\n📦 文件大小和下载速度分析")
     print("-" * 40)
     
-    sizes = [event.get('bytes', 0) for event in success_events if event.get('bytes')]
-    speeds = [event.get('speed_kbps', 0) for event in success_events if event.get('speed_kbps')]
+    sizes = stats['sizes']
+    speeds = stats['speeds']
     
     if sizes:
-        avg_size = statistics.mean(sizes)
-        size_percentiles = calculate_percentiles(sizes)
+        avg_size = int_mean(sizes)
+        sorted_sizes = sorted(sizes)
+        size_percentiles = calculate_percentiles(sorted_sizes, presorted=True)
         print(f"平均文件大小: {format_size(avg_size)}")
         print(f"文件大小中位数: {format_size(size_percentiles[50])}")
-        print(f"最大文件: {format_size(max(sizes))}")
+        print(f"最大文件: {format_size(sorted_sizes[-1])}")
     
     if speeds:
         avg_speed = statistics.mean(speeds)
-        speed_percentiles = calculate_percentiles(speeds)
+        sorted_speeds = sorted(speeds)
+        speed_percentiles = calculate_percentiles(sorted_speeds, presorted=True)
         print(f"平均下载速度: {avg_speed:.0f} KB/s")
         print(f"速度中位数: {speed_percentiles[50]:.0f} KB/s")
-        print(f"最高速度: {max(speeds):.0f} KB/s")
+        print(f"最高速度: {sorted_speeds[-1]:.0f} KB/s")
     
     # 6. 按小时统计
-    if hourly_stats:
+    if any(hourly_stats['success']) or any(hourly_stats['failed']):
         print(f"\n🕐 按小时活动统计")
         print("-" * 40)
         
         print(f"{'小时':<6} {'成功':<6} {'失败':<6} {'成功率':<8} {'平均耗时':<10} {'P95平均'}")
         print("-" * 60)
         
-        for hour in sorted(hourly_stats.keys()):
-            stats_hour = hourly_stats[hour]
-            success = stats_hour['success']
-            failed = stats_hour['failed']
+        for hour in range(24):
+            success = hourly_stats['success'][hour]
+            failed = hourly_stats['failed'][hour]
             total = success + failed
             
             if total > 0:
+                times_hour = hourly_stats['times'][hour]
                 success_rate_hour = success / total * 100
-                avg_time_hour = stats_hour['total_time'] / success if success > 0 else 0
-                p95_avg_hour = calculate_p95_average(stats_hour['times']) if stats_hour['times'] else 0
-                print(f"{hour}:00  {success:<6} {failed:<6} {success_rate_hour:6.1f}%  {format_time(avg_time_hour):<10} {format_time(p95_avg_hour)}")
+                avg_time_hour = hourly_stats['total_time'][hour] / success if success > 0 else 0
+                p95_avg_hour = calculate_p95_average(times_hour) if times_hour else 0
+                print(f"{hour:02d}:00  {success:<6} {failed:<6} {success_rate_hour:6.1f}%  {format_time(avg_time_hour):<10} {format_time(p95_avg_hour)}")
     
     # 7. 数据故事总结
     print(f"\n📖 数据故事总结")
     print("-" * 40)
     
     # 计算一些关键指标
-    fast_requests = sum(1 for t in all_times if t < 500)  # 500ms以下
-    slow_requests = sum(1 for t in all_times if t > 2000)  # 2秒以上
+    fast_requests = bisect_left(sorted_times, 500)  # 500ms以下
+    slow_requests = len(sorted_times) - bisect_right(sorted_times, 2000)  # 2秒以上
     
     print(f"🎯 关键发现:")
-    print(f"  • 在 {len(success_events):,} 次成功拉取中，{local_count:,} 次({local_count/len(success_events)*100:.1f}%)通过本地网关完成")
+    print(f"  • 在 {success_count:,} 次成功拉取中，{local_count:,} 次({local_count/success_count*100:.1f}%)通过本地网关完成")
     print(f"  • {fallback_count:,} 次需要回退到公共网关，说明本地网关的可用性有待提升")
-    print(f"  • {fast_requests:,} 次拉取在500ms内完成({fast_requests/len(success_events)*100:.1f}%)，用户体验良好")
+    print(f"  • {fast_requests:,} 次拉取在500ms内完成({fast_requests/success_count*100:.1f}%)，用户体验良好")
     
     if slow_requests > 0:
-        print(f"  • {slow_requests:,} 次拉取超过2秒({slow_requests/len(success_events)*100:.1f}%)，需要关注慢请求优化")
+        print(f"  • {slow_requests:,} 次拉取超过2秒({slow_requests/success_count*100:.1f}%)，需要关注慢请求优化")
     
     print(f"  • 平均拉取时间为 {format_time(avg_time)}，P95平均拉取时间为 {format_time(p95_avg_time)}，整体性能{'良好' if avg_time < 1000 else '一般' if avg_time < 2000 else '需要优化'}")
     
@@ -345,11 +440,11 @@ def print_report(stats):
         print(f"  • 最快的公共网关是 {best_gateway}，平均响应时间 {format_time(gateway_performance[0][1])}，P95平均响应时间 {format_time(gateway_performance[0][2])}")
     
     print(f"\n💡 优化建议:")
-    if local_count / len(success_events) < 0.5:
+    if local_count / success_count < 0.5:
         print(f"  • 考虑优化本地IPFS网关配置，提高本地成功率")
     if avg_time > 1000:
         print(f"  • 平均耗时较长，建议检查网络连接和网关配置")
-    if slow_requests / len(success_events) > 0.1:
+    if slow_requests / success_count > 0.1:
         print(f"  • 超过10%的请求较慢，建议增加更多高性能网关")
     
     print("\n" + "="*80)
@@ -366,20 +461,20 @@ def main():
         
         if args.json:
             # 输出JSON格式的统计数据
-            all_times = [event.get('total_elapsed_ms', 0) for event in stats['success_events']]
+            all_times = stats['success_times']
             overall_p95_avg = calculate_p95_average(all_times) if all_times else 0
-            overall_avg = statistics.mean(all_times) if all_times else 0
+            overall_avg = int_mean(all_times, stats['success_sum']) if all_times else 0
             
             json_stats = {
-                'total_success': len(stats['success_events']),
-                'total_failed': len(stats['failed_events']),
-                'local_success_count': len(stats['local_success']),
-                'fallback_success_count': len(stats['fallback_success']),
+                'total_success': len(all_times),
+                'total_failed': stats['failed_count'],
+                'local_success_count': len(stats['local_times']),
+                'fallback_success_count': len(stats['fallback_times']),
                 'overall_avg_time': overall_avg,
                 'overall_p95_avg_time': overall_p95_avg,
                 'gateway_stats': {k: {
                     'count': len(v), 
-                    'avg_time': statistics.mean(v) if v else 0,
+                    'avg_time': int_mean(v) if v else 0,
                     'p95_avg_time': calculate_p95_average(v) if v else 0
                 } for k, v in stats['gateway_stats'].items()}
             }
@@ -0,0 +1,18 @@
+"""
+日志分析脚本共用的统计工具
+"""
+
+import math
+
+
+def int_stdev(n: int, total: int, squares: int) -> float:
+    """由样本数、和、平方和计算整数样本的标准差（n >= 2）
+
+    方差 (n*squares - total^2) / (n*(n-1)) 全程是精确整数分式；放大后用 math.isqrt
+    开方，使平方根至少带 117 位有效位，只在最后转 float 时舍入一次。
+    与 statistics.stdev 的结果相同，除非真值离舍入边界不足 2^-64 ulp。
+    """
+    num = n * squares - total * total
+    den = n * (n - 1)
+    shift = max(0, 118 - (num.bit_length() - den.bit_length()) // 2)
+    return math.isqrt((num << 2 * shift) // den) / (1 << shift)